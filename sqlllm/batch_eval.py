@@ -0,0 +1,261 @@
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from nl2sql import (
+    DB_PATH, OPENROUTER_MODELS, LLM_MAX_WORKERS, LLM_MODEL_TIMEOUT, SQL_MAX_ROWS, SQL_TIMEOUT, run_model
+)
+from prompt_builder import build_prompt
+from feedback_store import FEEDBACK_DB_PATH, connect, upsert_feedback, pack_llm_output, encode_result
+from result_fingerprint import consensus_of
+
+# Requests per minute per provider (the part of the model id before "/"), overridable with --rate
+DEFAULT_RATE_PER_MINUTE = float(os.getenv("BATCH_RATE_PER_MINUTE", "60"))
+FLUSH_EVERY = 50
+
+# Token bucket: at most rate_per_minute calls per minute, with bursts up to burst calls
+class RateLimiter:
+    def __init__(self, rate_per_minute, burst=None):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self.capacity = burst or max(1, int(rate_per_minute // 60) or 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Take a token without waiting: 0.0 when one was taken, otherwise the seconds until the next one
+    def try_acquire(self):
+        if not self.interval:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) * self.interval
+
+
+def provider_of(model_id):
+    return model_id.split("/", 1)[0]
+
+# Questions from a CSV (a "question" column, optional "id") or JSONL file ({"question": ..., "id": ...}).
+# Returns [(question_id, question)]; ids default to the 1-based position in the file.
+def load_questions(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if path.endswith(".jsonl"):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = list(csv.DictReader(f))
+    questions = []
+    for idx, record in enumerate(records, 1):
+        question = (record.get("question") or "").strip()
+        if question:
+            questions.append((str(record.get("id") or idx), question))
+    return questions
+
+def batch_run_id(batch_name, question_id):
+    return f"batch_{batch_name}_{question_id}"
+
+# (run_id, llm_name) pairs of this batch already in llm_feedback, so an interrupted batch resumes.
+# With retry_errors, answers that failed are run again.
+def completed_pairs(conn, batch_name, retry_errors=False):
+    prefix = batch_run_id(batch_name, "")
+    rows = conn.execute(
+        "SELECT run_id, llm_name FROM llm_feedback WHERE substr(run_id, 1, ?) = ?"
+        + (" AND success != -1" if retry_errors else ""),
+        (len(prefix), prefix)
+    ).fetchall()
+    return set(rows)
+
+# Fingerprints already stored for a run, so a resumed question is labelled against every model
+def stored_fingerprints(conn, run_id):
+    return dict(conn.execute(
+        "SELECT llm_name, result_fingerprint FROM llm_feedback WHERE run_id = ?", (run_id,)
+    ).fetchall())
+
+# Batch results are not reviewed by a person. They are labelled from the models' agreement:
+# a result matching the consensus fingerprint is a success, a different result a failure, and SQL
+# that did not run an error. Without a consensus, success only says whether the SQL ran.
+def feedback_row(run_id, question, result, consensus=None):
+    failed = (result["SQL Output"] or "").startswith("Error")
+    typed = result.get("Result")
+    fingerprint = result.get("Fingerprint")
+    output = result["SQL Output"]
+    if failed:
+        success, comments = -1, "batch: SQL failed"
+    elif consensus is None:
+        success, comments = 1, "batch: SQL executed, no consensus to compare with"
+    elif fingerprint == consensus:
+        success, comments = 1, "batch: result agrees with the consensus"
+    else:
+        success, comments = 0, "batch: result differs from the consensus"
+    return {
+        "run_id": run_id,
+        "user_query": question,
+        "llm_name": result["Model"],
+        "llm_output": pack_llm_output(result["Generated SQL"], output),
+        "success": success,
+        "comments": comments,
+        "generated_sql": result["Generated SQL"],
+        "result_text": output,
+        "result_blob": encode_result(typed["columns"], typed["rows"]) if typed else None,
+        "latency_ms": result.get("Latency (ms)"),
+        "row_count": result.get("Row Count"),
+        "model_id": result.get("Model ID"),
+        "result_fingerprint": fingerprint,
+    }
+
+def run_batch(questions_path, batch_name=None, models=OPENROUTER_MODELS, db=DB_PATH, feedback_db=FEEDBACK_DB_PATH,
+              max_workers=LLM_MAX_WORKERS, rates=None, timeout=LLM_MODEL_TIMEOUT, use_cache=True,
+              max_rows=SQL_MAX_ROWS, sql_timeout=SQL_TIMEOUT, flush_every=FLUSH_EVERY, retry_errors=False):
+    batch_name = batch_name or os.path.splitext(os.path.basename(questions_path))[0]
+    questions = load_questions(questions_path)
+    conn = connect(feedback_db)
+    done = completed_pairs(conn, batch_name, retry_errors)
+    pairs = [
+        (batch_run_id(batch_name, qid), question, model)
+        for qid, question in questions for model in models
+        if (batch_run_id(batch_name, qid), model["name"]) not in done
+    ]
+    total = len(questions) * len(models)
+    print(f"Batch {batch_name}: {len(questions)} questions x {len(models)} models, "
+          f"{total - len(pairs)} already done, {len(pairs)} to run")
+    rates = rates or {}
+    limiters = {
+        provider: RateLimiter(rates.get(provider, rates.get("default", DEFAULT_RATE_PER_MINUTE)))
+        for provider in {provider_of(model["id"]) for model in models}
+    }
+    prompt = build_prompt(db)
+
+    def evaluate(run_id, question, model):
+        try:
+            return run_id, question, run_model(question, prompt, model, db, timeout, use_cache, max_rows, sql_timeout)
+        except Exception as e:
+            return run_id, question, e
+
+    # Answers are held until every model of their question has finished, so the question can be
+    # labelled from the consensus; pairs run question by question, which keeps this small
+    remaining = {}
+    for run_id, _, _ in pairs:
+        remaining[run_id] = remaining.get(run_id, 0) + 1
+    answered = {}
+    labelled = {"agree": 0, "differ": 0, "no_consensus": 0}
+    pending_rows = []
+
+    def finish_question(run_id, question):
+        results = answered.pop(run_id, [])
+        fingerprints = stored_fingerprints(conn, run_id) if len(results) < len(models) else {}
+        fingerprints.update({result["Model"]: result.get("Fingerprint") for result in results})
+        consensus = consensus_of(fingerprints)
+        for result in results:
+            row = feedback_row(run_id, question, result, consensus)
+            pending_rows.append(row)
+            if row["success"] != -1:
+                key = "no_consensus" if consensus is None else ("agree" if row["success"] == 1 else "differ")
+                labelled[key] += 1
+
+    written = 0
+    failed = 0
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal written
+        if pending_rows:
+            upsert_feedback(conn, pending_rows)
+            written += len(pending_rows)
+            pending_rows.clear()
+            rate = written / (time.perf_counter() - started)
+            print(f"[{total - len(pairs) + written}/{total}] saved ({rate:.1f} answers/s)")
+
+    # Pairs wait in one queue per provider and are submitted, round robin, only once that provider's
+    # limiter hands out a token, so a throttled provider never holds pool workers while the others
+    # keep running. A bounded number of pairs is in flight so memory stays flat for large files.
+    queues = {provider: deque() for provider in limiters}
+    for pair in pairs:
+        queues[provider_of(pair[2]["id"])].append(pair)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    in_flight = set()
+    try:
+        while True:
+            next_token = None
+            submitted = True
+            while submitted and len(in_flight) < max_workers * 2:
+                submitted = False
+                for provider, waiting in queues.items():
+                    if not waiting or len(in_flight) >= max_workers * 2:
+                        continue
+                    wait_seconds = limiters[provider].try_acquire()
+                    if wait_seconds:
+                        next_token = wait_seconds if next_token is None else min(next_token, wait_seconds)
+                        continue
+                    in_flight.add(executor.submit(evaluate, *waiting.popleft()))
+                    submitted = True
+            if not in_flight:
+                if next_token is None:
+                    break
+                time.sleep(next_token)
+                continue
+            finished, in_flight = wait(in_flight, timeout=next_token, return_when=FIRST_COMPLETED)
+            for future in finished:
+                run_id, question, result = future.result()
+                remaining[run_id] -= 1
+                if isinstance(result, Exception):
+                    failed += 1
+                    print(f"Evaluation failed: {result}")
+                else:
+                    answered.setdefault(run_id, []).append(result)
+                if not remaining[run_id]:
+                    finish_question(run_id, question)
+            if len(pending_rows) >= flush_every:
+                flush()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        flush()
+        conn.close()
+    elapsed = time.perf_counter() - started
+    print(f"Batch {batch_name} finished: {written} answers saved in {elapsed:.1f}s"
+          + (f", {failed} evaluations failed" if failed else ""))
+    print(f"Auto-labelled: {labelled['agree']} agree with the consensus, {labelled['differ']} differ, "
+          f"{labelled['no_consensus']} without a consensus")
+    return {"batch": batch_name, "written": written, "skipped": total - len(pairs), "failed": failed,
+            "seconds": elapsed, "labels": labelled}
+
+def parse_rates(values):
+    rates = {}
+    for value in values or []:
+        provider, _, rate = value.partition("=")
+        rates[provider] = float(rate)
+    return rates
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a file of questions across all models and save the answers to llm_feedback.db.")
+    parser.add_argument("questions", help="CSV with a 'question' column (optional 'id'), or JSONL with the same keys.")
+    parser.add_argument("--name", help="Batch name; runs are saved as batch_<name>_<question id> (default: file name).")
+    parser.add_argument("--models", help="Comma-separated model ids to run (default: all).")
+    parser.add_argument("--workers", type=int, default=LLM_MAX_WORKERS)
+    parser.add_argument("--rate", action="append", metavar="PROVIDER=PER_MINUTE",
+                        help="Requests per minute for a provider, e.g. openai=120 or default=30. Repeatable.")
+    parser.add_argument("--timeout", type=float, default=LLM_MODEL_TIMEOUT)
+    parser.add_argument("--max-rows", type=int, default=SQL_MAX_ROWS)
+    parser.add_argument("--sql-timeout", type=float, default=SQL_TIMEOUT)
+    parser.add_argument("--no-cache", action="store_true", help="Always call the models, even for cached questions.")
+    parser.add_argument("--flush-every", type=int, default=FLUSH_EVERY, help="Answers per write transaction.")
+    parser.add_argument("--retry-errors", action="store_true", help="Re-run answers of this batch that failed.")
+    parser.add_argument("--db", default=DB_PATH, help="Database the generated SQL runs against.")
+    parser.add_argument("--feedback-db", default=FEEDBACK_DB_PATH)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    models = OPENROUTER_MODELS
+    if args.models:
+        wanted = set(args.models.split(","))
+        models = [model for model in OPENROUTER_MODELS if model["id"] in wanted]
+    run_batch(args.questions, args.name, models, args.db, args.feedback_db, max_workers=args.workers, rates=parse_rates(args.rate),
+              timeout=args.timeout, use_cache=not args.no_cache, max_rows=args.max_rows,
+              sql_timeout=args.sql_timeout, flush_every=args.flush_every, retry_errors=args.retry_errors)
@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+import statistics
+import metrics
+from bulk_load import peak_rss_mb
+from rollups import refresh_rollups
+from db_utils import quote_identifier, table_exists
+from fake_openrouter import AnswerBook, FakeSettings, load_feedback_answers, start_server
+
+BENCH_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.benchmarks"))
+SOURCE_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../sales_data.db"))
+
+# Tables copied scale times over, with the prescriber key made unique per copy
+SCALE_KEYS = {
+    "Sales_Data": "presc_no",
+    "Presc_to_Terr": "presc_no",
+    "Presc_call_date": "Prescriber_ID",
+    "weekly_sales_fact": "presc_no",
+}
+
+# Questions with SQL that runs against the tables reset_and_import_from_csvs.py builds
+BUILTIN_WORKLOAD = [
+    ("Total units by product",
+     "SELECT prod_id, SUM(units) AS units FROM weekly_sales_fact GROUP BY prod_id;"),
+    ("Top 10 prescribers by units in the last 13 weeks",
+     "SELECT presc_no, units_13wk FROM rollup_prescriber_product ORDER BY units_13wk DESC LIMIT 10;"),
+    ("Weekly units by territory",
+     "SELECT territory, week_ending_date, SUM(units) FROM rollup_weekly_sales GROUP BY territory, week_ending_date;"),
+    ("Units per product in the latest 4 weeks",
+     "SELECT prod_id, SUM(units) FROM weekly_sales_fact WHERE week_ending_date > "
+     "(SELECT DATE(MAX(week_ending_date), '-28 days') FROM weekly_sales_fact) GROUP BY prod_id;"),
+    ("Prescribers with sales but no calls",
+     "SELECT COUNT(DISTINCT s.presc_no) FROM weekly_sales_fact s "
+     "LEFT JOIN Presc_call_date c ON c.Prescriber_ID = s.presc_no WHERE c.Prescriber_ID IS NULL;"),
+    ("Units in the most recent week by state",
+     "SELECT presc_st, SUM(week_bckt_1) FROM Sales_Data GROUP BY presc_st;"),
+]
+
+# Each scenario sets the stand-in's behaviour and how the pipeline is driven
+DEFAULT_SCENARIOS = [
+    {"name": "concurrent", "latency_ms": 300},
+    {"name": "sequential", "latency_ms": 300, "concurrent": False},
+    {"name": "one_slow_model", "latency_ms": 300, "model_latency_ms": {"openai/o1-mini": 2000}},
+    {"name": "flaky_provider", "latency_ms": 300, "error_rate": 0.2},
+    {"name": "warm_sql_cache", "latency_ms": 300, "warm_cache": True},
+    {"name": "streaming", "latency_ms": 300, "stream": True},
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the comparison pipeline offline against a local OpenRouter stand-in."
+    )
+    parser.add_argument("--scale", type=int, default=4, help="Copies of the prescriber-level data in the synthetic db.")
+    parser.add_argument("--source-db", default=SOURCE_DB_PATH)
+    parser.add_argument("--answers", choices=["builtin", "feedback"], default="builtin",
+                        help="Replay the built-in workload or the SQL recorded in llm_feedback.db.")
+    parser.add_argument("--scenarios", help="JSON file with a list of scenarios (default: built-in set).")
+    parser.add_argument("--repeat", type=int, default=1, help="Times each question is asked per scenario.")
+    parser.add_argument("--output", help="Report path (default: .benchmarks/report_<timestamp>.json).")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the synthetic db even if it exists.")
+    return parser.parse_args()
+
+# Copy the source db (indexes included) and multiply the prescriber-level tables; rollups are
+# rebuilt from the scaled fact table. The copy is reused while the source is unchanged.
+def build_scaled_db(source, scale, rebuild=False):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    target = os.path.join(BENCH_DIR, f"sales_data_x{scale}.db")
+    stamp = f"{os.path.getmtime(source)}:{os.path.getsize(source)}:{scale}"
+    if os.path.exists(target) and not rebuild:
+        conn = sqlite3.connect(target)
+        try:
+            row = conn.execute("SELECT stamp FROM benchmark_meta").fetchone() if table_exists(conn, "benchmark_meta") else None
+        finally:
+            conn.close()
+        if row and row[0] == stamp:
+            return target
+    if os.path.exists(target):
+        os.remove(target)
+    src = sqlite3.connect(source)
+    conn = sqlite3.connect(target)
+    src.backup(conn)
+    src.close()
+    start = time.perf_counter()
+    for table, key in SCALE_KEYS.items():
+        if not table_exists(conn, table):
+            continue
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+        original = conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(table)}").fetchone()[0] or 0
+        for copy in range(1, scale):
+            select = ", ".join(
+                f"{quote_identifier(col)} || '_{copy}'" if col == key else quote_identifier(col) for col in columns
+            )
+            conn.execute(
+                f"INSERT INTO {quote_identifier(table)} SELECT {select} FROM {quote_identifier(table)} WHERE rowid <= ?",
+                (original,)
+            )
+        conn.commit()
+    if table_exists(conn, "Presc_to_Terr") and table_exists(conn, "Product_Data"):
+        refresh_rollups(conn, "Presc_to_Terr", "Product_Data", full=True)
+    conn.execute("CREATE TABLE IF NOT EXISTS benchmark_meta (stamp TEXT)")
+    conn.execute("DELETE FROM benchmark_meta")
+    conn.execute("INSERT INTO benchmark_meta VALUES (?)", (stamp,))
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    print(f"Built {target} (scale {scale}) in {time.perf_counter() - start:.1f}s")
+    return target
+
+def table_sizes(db):
+    conn = sqlite3.connect(db)
+    try:
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table)}").fetchone()[0]
+                for table in SCALE_KEYS if table_exists(conn, table)}
+    finally:
+        conn.close()
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def percentile(values, q):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+def summarize_ms(values):
+    values = [v * 1000 for v in values]
+    return {
+        "mean_ms": statistics.fmean(values) if values else None,
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "max_ms": max(values) if values else None,
+    }
+
+def run_scenario(scenario, questions, db, settings, nl2sql, prompt, repeat=1):
+    settings.update(
+        latency_ms=scenario.get("latency_ms", 200),
+        jitter=scenario.get("jitter", 0.3),
+        error_rate=scenario.get("error_rate", 0.0),
+        error_status=scenario.get("error_status", 500),
+        model_latency_ms=scenario.get("model_latency_ms", {}),
+        token_delay_ms=scenario.get("token_delay_ms", 20),
+    )
+    concurrent = scenario.get("concurrent", True)
+    warm_cache = scenario.get("warm_cache", False)
+    stream = scenario.get("stream", False)
+    question_seconds = []
+    model_seconds = []
+    ttft_seconds = []
+    sql_seconds = []
+    errors = 0
+    answers = 0
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for question in questions:
+            if not warm_cache:
+                nl2sql.result_cache.clear()
+            t0 = time.perf_counter()
+            results = nl2sql.run_comparison(
+                question, prompt, nl2sql.OPENROUTER_MODELS, db=db, concurrent=concurrent,
+                max_workers=scenario.get("max_workers", nl2sql.LLM_MAX_WORKERS),
+                timeout=scenario.get("timeout", nl2sql.LLM_MODEL_TIMEOUT), use_cache=False, stream=stream
+            )
+            question_seconds.append(time.perf_counter() - t0)
+            for result in results:
+                answers += 1
+                if result["SQL Output"].startswith("Error"):
+                    errors += 1
+                if result.get("Latency (ms)") is not None:
+                    model_seconds.append(result["Latency (ms)"] / 1000)
+                if result.get("TTFT (ms)") is not None:
+                    ttft_seconds.append(result["TTFT (ms)"] / 1000)
+                if result.get("Result") is not None:
+                    sql_seconds.append(result["Result"]["elapsed"])
+    wall = time.perf_counter() - started
+    rss_after = current_rss_mb()
+    return {
+        "name": scenario["name"],
+        "settings": scenario,
+        "questions": len(question_seconds),
+        "answers": answers,
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_questions_per_s": len(question_seconds) / wall if wall else None,
+        "throughput_answers_per_s": answers / wall if wall else None,
+        "end_to_end": summarize_ms(question_seconds),
+        "per_model": summarize_ms(model_seconds),
+        "time_to_first_token": summarize_ms(ttft_seconds),
+        "sql_execution": summarize_ms(sql_seconds),
+        "provider_requests": settings.requests,
+        "injected_errors": settings.errors,
+        "rss_mb": rss_after,
+        "rss_delta_mb": rss_after - rss_before if rss_after is not None and rss_before is not None else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def main(scale=4, source_db=SOURCE_DB_PATH, answers="builtin", scenarios=None, repeat=1, output=None,
+         rebuild=False):
+    db = build_scaled_db(source_db, scale, rebuild)
+    book = AnswerBook()
+    settings = FakeSettings(seed=0)
+    server, url = start_server(book, settings)
+    # The client reads its endpoint and key at import time, so the pipeline is imported only
+    # once the stand-in is listening
+    os.environ["OPENROUTER_URL"] = url
+    os.environ.setdefault("OPENROUTER_API_KEY", "offline-benchmark")
+    if "openrouter_client" in sys.modules:
+        sys.modules["openrouter_client"].OPENROUTER_URL = url
+    import nl2sql
+    from prompt_builder import build_prompt
+    nl2sql.OPENROUTER_API_KEY = nl2sql.OPENROUTER_API_KEY or os.environ["OPENROUTER_API_KEY"]
+    metrics.METRICS_ENABLED = False
+
+    if answers == "feedback":
+        recorded = load_feedback_answers({model["name"]: model["id"] for model in nl2sql.OPENROUTER_MODELS})
+        book.answers, book.by_question = recorded.answers, recorded.by_question
+        questions = book.questions()
+    else:
+        for question, sql in BUILTIN_WORKLOAD:
+            book.add("*", question, sql)
+        questions = [question for question, _ in BUILTIN_WORKLOAD]
+    prompt = build_prompt(db)
+
+    report = {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "db": {"path": db, "scale": scale, "rows": table_sizes(db)},
+        "answers": answers,
+        "models": [model["id"] for model in nl2sql.OPENROUTER_MODELS],
+        "scenarios": [],
+    }
+    try:
+        for scenario in scenarios or DEFAULT_SCENARIOS:
+            result = run_scenario(scenario, questions, db, settings, nl2sql, prompt, repeat)
+            report["scenarios"].append(result)
+            print(f"{result['name']}: p50 {result['end_to_end']['p50_ms']:.0f} ms, "
+                  f"p95 {result['end_to_end']['p95_ms']:.0f} ms per question, "
+                  f"{result['throughput_answers_per_s']:.1f} answers/s, {result['errors']} errors")
+    finally:
+        server.shutdown()
+    output = output or os.path.join(BENCH_DIR, f"report_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}")
+    return report
+
+if __name__ == "__main__":
+    args = parse_args()
+    scenarios = None
+    if args.scenarios:
+        with open(args.scenarios) as f:
+            scenarios = json.load(f)
+    main(args.scale, args.source_db, args.answers, scenarios, args.repeat, args.output, args.rebuild)
@@ -0,0 +1,76 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from export_llm_feedback import wide_frame, with_sql_and_output
+
+MODEL_NAMES = ["Claude 3 Sonnet", "Gemini 1.5 Flash", "GPT-4o", "O1-mini", "O4-mini", "Qwen 3 (reasoning)"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the per-run loop and the pivot for the wide feedback export.")
+    parser.add_argument("--rows", type=int, default=100000, help="Synthetic feedback rows to generate.")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+# Synthetic llm_feedback rows in id order: runs of up to six models, some models missing from a run,
+# and a few repeated (run, model) rows so "latest row wins" is exercised. A quarter of the rows only
+# have the packed llm_output, like rows written before the structured columns.
+def synthetic_feedback(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    run_ids = np.char.add("run_", (np.arange(rows) // len(MODEL_NAMES)).astype(str))
+    llm_names = np.array(MODEL_NAMES)[rng.integers(0, len(MODEL_NAMES), rows)]
+    sql = np.char.add("SELECT COUNT(*) FROM weekly_sales_fact WHERE prod_id = ", rng.integers(0, 500, rows).astype(str))
+    output = np.char.add("|   COUNT(*) |\n|-----------:|\n| ", rng.integers(0, 10000, rows).astype(str))
+    df = pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "run_id": run_ids,
+        "llm_name": llm_names,
+        "generated_sql": sql,
+        "result_text": output,
+    }).astype({"run_id": "string", "llm_name": "string", "generated_sql": "string", "result_text": "string"})
+    df["llm_output"] = ("SQL: " + df["generated_sql"] + "\nOutput: " + df["result_text"]).astype("string")
+    legacy = rng.random(rows) < 0.25
+    df.loc[legacy, ["generated_sql", "result_text"]] = pd.NA
+    return df
+
+# The wide export as it was before the pivot (filter every run's group once per model), taking
+# the latest row per model so both produce the same table
+def wide_frame_loop(df):
+    df = with_sql_and_output(df)
+    llm_order = df.drop_duplicates('llm_name')['llm_name'].tolist()
+    wide_rows = []
+    for run_id, group in df.groupby('run_id'):
+        row = {'run_id': run_id}
+        for idx, llm in enumerate(llm_order, 1):
+            llm_row = group[group['llm_name'] == llm]
+            if not llm_row.empty:
+                llm_row = llm_row.iloc[-1]
+                row[f'Model Name {idx}'] = llm_row['llm_name']
+                row[f'Query Created by Model {idx}'] = llm_row['sql']
+                row[f'Output of Model {idx}'] = llm_row['output']
+            else:
+                row[f'Model Name {idx}'] = ''
+                row[f'Query Created by Model {idx}'] = ''
+                row[f'Output of Model {idx}'] = ''
+        wide_rows.append(row)
+    return pd.DataFrame(wide_rows)
+
+def timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df.copy())
+    return result, time.perf_counter() - start
+
+def main(rows, seed=0):
+    df = synthetic_feedback(rows, seed)
+    print(f"{len(df)} feedback rows, {df['run_id'].nunique()} runs")
+    loop_df, loop_seconds = timed(wide_frame_loop, df)
+    pivot_df, pivot_seconds = timed(wide_frame, df)
+    same = loop_df.astype(str).reset_index(drop=True).equals(pivot_df.astype(str).reset_index(drop=True))
+    print(f"per-run loop: {loop_seconds:.2f}s")
+    print(f"pivot:        {pivot_seconds:.2f}s ({loop_seconds / max(pivot_seconds, 1e-9):.0f}x faster)")
+    print(f"identical output: {same}")
+    return {"loop_seconds": loop_seconds, "pivot_seconds": pivot_seconds, "identical": same}
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.rows, args.seed)
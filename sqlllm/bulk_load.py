@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from weekly_sales import bucket_number, BUCKET_DECIMALS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CHUNK_SIZE = int(os.getenv("BULK_LOAD_CHUNK_SIZE", "50000"))
+# Load-time PRAGMAs: WAL keeps readers working during a load, synchronous=OFF and a 256 MiB
+# page cache make the single big transaction cheap.
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA temp_store = MEMORY",
+]
+RESTORE_PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",
+]
+# Identifier columns are parsed as categories and indexed once the data is in
+ID_COLUMNS = {"presc_no", "prod_id", "plan_id", "Territory", "Prescriber ID", "Prescriber_ID", "RepId", "outlet_id"}
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def clean_column_name(name):
+    return name.replace(' ', '_')
+
+def is_bucket_column(name):
+    return bucket_number(name) is not None or name.startswith("mth_sales_")
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB on Linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def apply_load_pragmas(conn):
+    for pragma in LOAD_PRAGMAS:
+        conn.execute(pragma)
+
+def restore_pragmas(conn):
+    for pragma in RESTORE_PRAGMAS:
+        conn.execute(pragma)
+
+# True where a float64 value survives float32 storage and rounding to BUCKET_DECIMALS unchanged.
+# float32 holds about 7 significant digits, so e.g. 123456.78 or 0.1234567 do not.
+def fits_float32(values):
+    restored = values.astype(np.float32).astype(np.float64).round(BUCKET_DECIMALS)
+    return np.isnan(values) | (restored == values)
+
+# Numeric types inferred from the sample are checked against the whole file, reading only those
+# columns. A column with any value that does not fit (e.g. a ZIP+4 after thousands of 5-digit
+# ZIPs) is loaded as text, like a plain read_csv over the whole file would. float32 bucket
+# columns holding a value float32 cannot round-trip are kept as float64 instead.
+def _verify_numeric_columns(csv_path, dtypes, chunksize=CHUNK_SIZE):
+    numeric = [col for col, dtype in dtypes.items() if dtype in ("Int64", np.float64)]
+    buckets = [col for col, dtype in dtypes.items() if dtype is np.float32]
+    if not numeric and not buckets:
+        return dtypes
+    read_as = dict({col: str for col in numeric}, **{col: np.float64 for col in buckets})
+    for chunk in pd.read_csv(csv_path, encoding="utf-8-sig", usecols=numeric + buckets, dtype=read_as,
+                             chunksize=chunksize):
+        for col in buckets:
+            if dtypes[col] is np.float32 and not fits_float32(chunk[col].to_numpy()).all():
+                print(f"Column {col} of {os.path.basename(csv_path)} needs more precision than float32; "
+                      f"loading it as float64.")
+                dtypes[col] = np.float64
+        for col in numeric:
+            if dtypes[col] is str:
+                continue
+            values = chunk[col].dropna()
+            parsed = pd.to_numeric(values, errors="coerce")
+            if parsed.isna().any() or (dtypes[col] == "Int64" and (parsed % 1 != 0).any()):
+                print(f"Column {col} of {os.path.basename(csv_path)} has non-numeric values; loading it as text.")
+                dtypes[col] = str
+    return dtypes
+
+# Explicit dtypes so every chunk parses the same way: float32 buckets (float64 for columns whose
+# values float32 cannot hold), category ids, and whatever pandas infers from a sample (verified
+# against the whole file) for the rest.
+def csv_dtypes(csv_path, sample_rows=2000):
+    sample = pd.read_csv(csv_path, encoding="utf-8-sig", nrows=sample_rows)
+    dtypes = {}
+    for col, dtype in sample.dtypes.items():
+        if is_bucket_column(col):
+            dtypes[col] = np.float32
+        elif col in ID_COLUMNS:
+            dtypes[col] = "category"
+        elif pd.api.types.is_integer_dtype(dtype):
+            dtypes[col] = "Int64"
+        elif pd.api.types.is_float_dtype(dtype):
+            dtypes[col] = np.float64
+        else:
+            dtypes[col] = str
+    return _verify_numeric_columns(csv_path, dtypes)
+
+def sqlite_type(dtype):
+    if dtype in (np.float32, np.float64):
+        return "REAL"
+    if dtype == "Int64":
+        return "INTEGER"
+    return "TEXT"
+
+# Map CSV columns onto an existing table: exact name, cleaned name, or the same bucket number
+# (week_bckt_12 -> bckt12 for the schema created by sqlite.py)
+def _map_to_table(conn, table, csv_columns):
+    table_cols = [row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table)})")]
+    by_bucket = {bucket_number(c): c for c in table_cols if bucket_number(c) is not None}
+    mapping = {}
+    for col in csv_columns:
+        if col in table_cols:
+            mapping[col] = col
+        elif clean_column_name(col) in table_cols:
+            mapping[col] = clean_column_name(col)
+        elif bucket_number(col) in by_bucket:
+            mapping[col] = by_bucket[bucket_number(col)]
+    skipped = [c for c in csv_columns if c not in mapping]
+    if skipped:
+        print(f"Skipping columns not in {table}: {', '.join(skipped)}")
+    return mapping
+
+def create_indexes(conn, table, columns, commit=True):
+    for col in columns:
+        if col in ID_COLUMNS:
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {_quote('idx_' + table + '_' + clean_column_name(col))} "
+                f"ON {_quote(table)} ({_quote(col)})"
+            )
+    if commit:
+        conn.commit()
+
+# Prepare one parsed chunk for executemany: float32 buckets back to float64, rounded to
+# BUCKET_DECIMALS. csv_dtypes only keeps float32 for columns where that restores the CSV values.
+def _chunk_rows(chunk, csv_columns):
+    for col in csv_columns:
+        if chunk[col].dtype == np.float32:
+            chunk[col] = chunk[col].astype(np.float64).round(BUCKET_DECIMALS)
+        elif chunk[col].dtype == "Int64":
+            chunk[col] = chunk[col].astype(object).where(chunk[col].notna(), None)
+    return chunk[csv_columns].itertuples(index=False, name=None)
+
+# Stream a CSV into a table in one transaction. With create=True the table is (re)created from
+# the CSV header, otherwise rows replace the contents of the existing table (created if missing).
+# Staging loads pass build_indexes=False and index the table once it is swapped in.
+def bulk_load_csv(conn, table, csv_path, create=True, clean_columns=False, chunksize=CHUNK_SIZE, build_indexes=True):
+    dtypes = csv_dtypes(csv_path)
+    frames = pd.read_csv(csv_path, encoding="utf-8-sig", dtype=dtypes, chunksize=chunksize)
+    return bulk_load_frames(conn, table, frames, dtypes, create, clean_columns, build_indexes,
+                            source=os.path.basename(csv_path))
+
+# Insert already parsed DataFrame batches (all typed with `dtypes`) into a table in one transaction
+def bulk_load_frames(conn, table, frames, dtypes, create=True, clean_columns=False, build_indexes=True, source=None):
+    start = time.perf_counter()
+    apply_load_pragmas(conn)
+    csv_columns = list(dtypes)
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if create or not exists:
+        table_columns = [clean_column_name(c) if clean_columns else c for c in csv_columns]
+        column_defs = ", ".join(f"{_quote(name)} {sqlite_type(dtypes[col])}" for col, name in zip(csv_columns, table_columns))
+        conn.commit()
+        conn.execute("BEGIN")
+        conn.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+        conn.execute(f"CREATE TABLE {_quote(table)} ({column_defs})")
+    else:
+        mapping = _map_to_table(conn, table, csv_columns)
+        csv_columns = [c for c in csv_columns if c in mapping]
+        table_columns = [mapping[c] for c in csv_columns]
+        conn.commit()
+        conn.execute("BEGIN")
+        conn.execute(f"DELETE FROM {_quote(table)}")
+    insert_sql = (
+        f"INSERT INTO {_quote(table)} ({', '.join(_quote(c) for c in table_columns)}) "
+        f"VALUES ({', '.join('?' for _ in table_columns)})"
+    )
+    rows = 0
+    try:
+        for chunk in frames:
+            conn.executemany(insert_sql, _chunk_rows(chunk, csv_columns))
+            rows += len(chunk)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        restore_pragmas(conn)
+    if build_indexes:
+        create_indexes(conn, table, table_columns)
+    elapsed = time.perf_counter() - start
+    stats = {
+        "table": table,
+        "columns": table_columns,
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_sec": rows / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    rss = f", peak RSS {stats['peak_rss_mb']:.0f} MB" if stats["peak_rss_mb"] is not None else ""
+    print(f"Loaded {rows} rows into {table} from {source or 'data frames'} "
+          f"in {elapsed:.2f}s ({stats['rows_per_sec']:.0f} rows/sec{rss}).")
+    return stats
@@ -0,0 +1,105 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+POOL_SIZE = int(os.getenv("SALES_DB_POOL_SIZE", "8"))
+# Negative cache_size is in KiB: 64 MiB page cache per connection, 256 MiB memory map
+CACHE_SIZE_KIB = int(os.getenv("SALES_DB_CACHE_SIZE_KIB", "65536"))
+MMAP_SIZE = int(os.getenv("SALES_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Small pool of read-only connections. Connections keep their page cache and statement cache
+# between queries, and generated SQL cannot write through them.
+class ReadOnlyConnectionPool:
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = os.path.abspath(db_path)
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._file_id = None
+
+    def _connect(self):
+        uri = f"file:{pathname2url(self.db_path)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    # Drop idle connections if the database file was replaced rather than updated in place
+    def _check_file(self):
+        st = os.stat(self.db_path)
+        file_id = (st.st_dev, st.st_ino)
+        with self._lock:
+            if self._file_id is not None and self._file_id != file_id:
+                while True:
+                    try:
+                        self._idle.get_nowait().close()
+                    except queue.Empty:
+                        break
+                    self._created -= 1
+            self._file_id = file_id
+            return file_id
+
+    def acquire(self, timeout=None):
+        file_id = self._check_file()
+        try:
+            return self._idle.get_nowait(), file_id
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect(), file_id
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=timeout), file_id
+
+    def release(self, conn, file_id=None):
+        with self._lock:
+            stale = file_id is not None and file_id != self._file_id
+            if stale:
+                self._created -= 1
+        if stale:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn, file_id = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn, file_id)
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._created -= 1
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# One pool per database path, shared by every Streamlit session in the process
+def get_pool(db_path, size=POOL_SIZE):
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ReadOnlyConnectionPool(key, size)
+        return _pools[key]
@@ -0,0 +1,21 @@
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+# Replace `table` with a fully loaded `staging` table in one transaction. Readers keep seeing the
+# old table until the commit, so there is no window where the table is missing or half loaded.
+# after_swap(conn) runs inside the same transaction (index creation, manifest updates).
+def swap_table(conn, staging, table, after_swap=None):
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table)}")
+        conn.execute(f"ALTER TABLE {quote_identifier(staging)} RENAME TO {quote_identifier(table)}")
+        if after_swap is not None:
+            after_swap(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
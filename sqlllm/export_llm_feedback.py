@@ -0,0 +1,285 @@
+import os
+import re
+import json
+import datetime
+import argparse
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from feedback_store import FEEDBACK_DB_PATH, connect_readonly, result_markdown
+from metrics import timed
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for --format parquet
+    pa = None
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+# Where --since-last remembers, per output file, the feedback timestamp it has exported up to.
+# Kept outside llm_feedback.db so exporting never writes to the feedback database.
+EXPORT_STATE_PATH = os.getenv(
+    "EXPORT_STATE_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../llm_feedback_export_state.json"))
+)
+
+LAYOUTS = ["long", "wide", "raw"]
+FORMATS = ["xlsx", "csv", "parquet"]
+
+# Default output file per layout, next to llm_feedback.db (the names the old scripts used)
+DEFAULT_OUTPUTS = {
+    "raw": "llm_feedback_export",
+    "long": "llm_feedback_export_long",
+    "wide": "llm_feedback_export_wide",
+}
+
+# Every feedback column except the binary result_blob, which only parquet can hold
+RAW_DTYPES = {
+    "id": "Int64", "run_id": "string", "user_query": "string", "llm_name": "string",
+    "llm_output": "string", "success": "Int64", "comments": "string", "timestamp": "string",
+    "generated_sql": "string", "result_text": "string", "latency_ms": "Int64", "row_count": "Int64",
+    "model_id": "string", "result_fingerprint": "string",
+}
+
+def default_output(layout, fmt):
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), f"../{DEFAULT_OUTPUTS[layout]}.{fmt}"))
+
+# Vectorized split of packed llm_output text, for rows written before the structured columns
+def split_llm_output(llm_output):
+    text = llm_output.fillna("")
+    generated_sql = text.str.extract(r"SQL:(.*?)Output:", flags=re.DOTALL)[0].fillna("").str.strip()
+    output = text.str.extract(r"Output:(.*)", flags=re.DOTALL)[0].str.strip()
+    return generated_sql, output.fillna(llm_output)
+
+# Generated SQL and output per row: the structured columns where the row has them, otherwise
+# parsed from llm_output
+def with_sql_and_output(chunk):
+    missing = chunk["generated_sql"].isna()
+    chunk["sql"] = chunk["generated_sql"]
+    chunk["output"] = chunk["result_text"]
+    if missing.any():
+        parsed_sql, parsed_output = split_llm_output(chunk.loc[missing, "llm_output"])
+        chunk.loc[missing, "sql"] = parsed_sql
+        chunk.loc[missing, "output"] = parsed_output
+    return chunk
+
+# Rows stored with a result_blob keep only a summary in result_text; the markdown table is built
+# here, above that summary, and the blob column is dropped. Rows that already hold the table
+# (written while it was stored eagerly) are left as they are. Recorded as the "render" stage.
+def with_result_markdown(chunk):
+    if "result_blob" not in chunk:
+        return chunk
+    has_blob = chunk["result_blob"].notna()
+    if has_blob.any():
+        with timed("render", rows=int(has_blob.sum())):
+            tables = chunk.loc[has_blob, "result_blob"].map(result_markdown)
+        summaries = chunk.loc[has_blob, "result_text"].fillna("")
+        chunk.loc[has_blob, "result_text"] = [
+            summary if table is None or summary.startswith("|") else f"{table}\n\n{summary}"
+            for table, summary in zip(tables, summaries)
+        ]
+    return chunk.drop(columns="result_blob")
+
+def long_frame(chunk):
+    chunk = with_sql_and_output(chunk)
+    return pd.DataFrame({
+        "run_id": chunk["run_id"],
+        "Model Name": chunk["llm_name"],
+        "Query Created by Model": chunk["sql"],
+        "Output of Model": chunk["output"],
+        "off": "",
+    })
+
+WIDE_FIELDS = [
+    ("model", "Model Name"),
+    ("sql", "Query Created by Model"),
+    ("output", "Output of Model"),
+]
+
+# One row per run with Model Name N / Query Created by Model N / Output of Model N columns,
+# models numbered in order of first appearance. Expects rows in id order; the latest row per
+# run and model wins. Built with a single pivot instead of filtering each run per model.
+def wide_frame(df):
+    df = with_sql_and_output(df)
+    df = df[df["run_id"].notna()]
+    llm_order = df.drop_duplicates("llm_name")["llm_name"].tolist()
+    latest = df.drop_duplicates(["run_id", "llm_name"], keep="last")
+    values = latest[["run_id", "llm_name", "sql", "output"]].assign(model=latest["llm_name"])
+    pivoted = values.pivot(index="run_id", columns="llm_name", values=[field for field, _ in WIDE_FIELDS])
+    pivoted = pivoted.reindex(columns=pd.MultiIndex.from_tuples(
+        [(field, llm) for llm in llm_order for field, _ in WIDE_FIELDS]
+    ))
+    pivoted.columns = [f"{label} {idx}" for idx in range(1, len(llm_order) + 1) for _, label in WIDE_FIELDS]
+    return pivoted.astype(object).fillna("").reset_index()
+
+def load_export_state(state_path=EXPORT_STATE_PATH):
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path, encoding="utf-8") as f:
+        return json.load(f)
+
+# Timestamp up to which output_path has been exported ("" when never)
+def get_exported_until(output_path, state_path=EXPORT_STATE_PATH):
+    return load_export_state(state_path).get(output_path, {}).get("exported_until", "")
+
+def set_exported_until(output_path, layout, exported_until, state_path=EXPORT_STATE_PATH):
+    state = load_export_state(state_path)
+    state[output_path] = {
+        "layout": layout,
+        "exported_until": exported_until,
+        "exported_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+# Feedback rows in id order, as DataFrame chunks. With since set, only rows inserted or updated
+# (the upsert refreshes timestamp) in [since, until) are read; until is the second the export
+# started, so rows written during that second are picked up by the next export instead of being
+# missed. For the wide layout every row of a touched run is read, so runs are exported whole.
+def iter_feedback_chunks(conn, layout, since="", until=None, chunksize=EXPORT_CHUNK_SIZE, include_blob=False):
+    # Columns a database from before the structured columns lacks are exported empty; the
+    # exporter never alters the schema
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(llm_feedback)")}
+    columns = [
+        col if col in existing else f"NULL AS {col}"
+        for col in list(RAW_DTYPES) + (["result_blob"] if include_blob else [])
+    ]
+    where, params = "1", ()
+    if until is not None:
+        changed = "timestamp >= ? AND timestamp < ?"
+        params = (since, until)
+        where = changed if layout != "wide" else f"run_id IN (SELECT run_id FROM llm_feedback WHERE {changed})"
+    return pd.read_sql_query(
+        f"SELECT {', '.join(columns)} FROM llm_feedback WHERE {where} ORDER BY id",
+        conn, params=params, chunksize=chunksize, dtype=RAW_DTYPES
+    )
+
+# Incremental output that cannot be appended to goes to a delta file next to the full export,
+# e.g. llm_feedback_export_wide.delta-20250101T120000.xlsx
+def delta_output(output_path, until):
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}.delta-{until.replace('-', '').replace(':', '').replace(' ', 'T')}{ext}"
+
+# Writers consume DataFrame chunks one at a time and return the number of rows written
+def _excel_value(value):
+    if value is None or value is pd.NA or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub("", value)
+    return value
+
+def write_xlsx(frames, output_path):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    rows = 0
+    header_written = False
+    for frame in frames:
+        if not header_written:
+            ws.append(list(frame.columns))
+            header_written = True
+        for record in frame.itertuples(index=False, name=None):
+            ws.append([_excel_value(value) for value in record])
+        rows += len(frame)
+    if not header_written:
+        return 0
+    wb.save(output_path)
+    return rows
+
+def write_csv(frames, output_path, append=False):
+    rows = 0
+    header = not (append and os.path.exists(output_path))
+    mode = "a" if append else "w"
+    for frame in frames:
+        frame.to_csv(output_path, mode=mode, header=header, index=False)
+        mode, header = "a", False
+        rows += len(frame)
+    return rows
+
+def write_parquet(frames, output_path):
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).")
+    writer = None
+    rows = 0
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+# Export llm_feedback in the given layout and format. With incremental=True only rows inserted or
+# updated since the previous incremental export to the same output are written: long and raw CSV
+# output is appended to, other formats and the wide layout get a separate delta file (the first
+# incremental export writes output_path itself). Returns (rows written, file written).
+def export(layout="long", fmt="xlsx", output_path=None, incremental=False, chunksize=EXPORT_CHUNK_SIZE,
+           db_path=FEEDBACK_DB_PATH):
+    output_path = os.path.abspath(output_path or default_output(layout, fmt))
+    conn = connect_readonly(db_path)
+    since, until = "", None
+    target = output_path
+    append = False
+    if incremental:
+        since = get_exported_until(output_path)
+        until = conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+        if os.path.exists(output_path):
+            append = fmt == "csv" and layout != "wide"
+            target = output_path if append else delta_output(output_path, until)
+
+    def frames():
+        chunks = iter_feedback_chunks(conn, layout, since, until, chunksize,
+                                      include_blob=(fmt == "parquet" or layout != "raw"))
+        if layout == "wide":
+            # A run's rows can be spread over chunks, so only the narrow columns are collected
+            # before pivoting
+            keep = ["id", "run_id", "llm_name", "llm_output", "generated_sql", "result_text"]
+            df = pd.concat(
+                [with_result_markdown(chunk)[keep] for chunk in chunks if not chunk.empty] or [pd.DataFrame()],
+                ignore_index=True
+            )
+            if not df.empty:
+                yield wide_frame(df)
+            return
+        for chunk in chunks:
+            if not chunk.empty:
+                yield long_frame(with_result_markdown(chunk)) if layout == "long" else chunk
+
+    try:
+        if fmt == "xlsx":
+            rows = write_xlsx(frames(), target)
+        elif fmt == "csv":
+            rows = write_csv(frames(), target, append=append)
+        else:
+            rows = write_parquet(frames(), target)
+    finally:
+        conn.close()
+    if incremental:
+        set_exported_until(output_path, layout, until)
+    if rows:
+        print(f"Exported {rows} {layout}-format llm_feedback rows to {target}")
+    else:
+        print("No data to export.")
+    return rows, target
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export llm_feedback.db to Excel, CSV or Parquet.")
+    parser.add_argument("--layout", choices=LAYOUTS, default="long",
+                        help="long: one row per run and model; wide: one row per run; raw: the table as stored.")
+    parser.add_argument("--format", choices=FORMATS, default="xlsx")
+    parser.add_argument("--output", help="Output file (default: llm_feedback_export[_layout].<format> in the repo root).")
+    parser.add_argument("--since-last", action="store_true",
+                        help="Only export rows added or updated since the last --since-last export to the same output "
+                             "(appended for long/raw CSV, otherwise written to a .delta-<time> file).")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument("--db", default=FEEDBACK_DB_PATH)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    export(args.layout, args.format, args.output, args.since_last, args.chunk_size, args.db)
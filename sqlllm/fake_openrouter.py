@@ -0,0 +1,190 @@
+import re
+import json
+import time
+import random
+import sqlite3
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from response_cache import normalize_question
+from feedback_store import FEEDBACK_DB_PATH, parse_llm_output
+
+DEFAULT_ANSWER = "SELECT COUNT(*) FROM weekly_sales_fact;"
+
+# Answers a local stand-in replays, keyed by (model id, normalized question). Lookups fall back to
+# any model's answer for the question, then to DEFAULT_ANSWER.
+class AnswerBook:
+    def __init__(self, answers=None, default=DEFAULT_ANSWER):
+        self.answers = {}
+        self.by_question = {}
+        self.default = default
+        for (model_id, question), sql in (answers or {}).items():
+            self.add(model_id, question, sql)
+
+    def add(self, model_id, question, sql):
+        key = normalize_question(question)
+        self.answers[(model_id, key)] = sql
+        self.by_question.setdefault(key, sql)
+
+    def lookup(self, model_id, question):
+        key = normalize_question(question)
+        return self.answers.get((model_id, key)) or self.by_question.get(key) or self.default
+
+    def questions(self):
+        return list(self.by_question)
+
+# Recorded answers from llm_feedback.db; model names are mapped to ids with name_to_id
+def load_feedback_answers(name_to_id, db_path=FEEDBACK_DB_PATH):
+    book = AnswerBook()
+    conn = sqlite3.connect(db_path)
+    try:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(llm_feedback)")]
+        sql_column = "generated_sql" if "generated_sql" in columns else "NULL"
+        rows = conn.execute(
+            f"SELECT user_query, llm_name, {sql_column}, llm_output FROM llm_feedback ORDER BY id"
+        ).fetchall()
+    finally:
+        conn.close()
+    for question, llm_name, generated_sql, llm_output in rows:
+        sql = generated_sql if generated_sql is not None else parse_llm_output(llm_output)[0]
+        if question and sql and not sql.startswith("Error"):
+            book.add(name_to_id.get(llm_name, llm_name), question, sql)
+    return book
+
+# Behaviour of the stand-in; fields can be changed between scenarios while the server runs
+class FakeSettings:
+    def __init__(self, latency_ms=200, jitter=0.3, error_rate=0.0, error_status=500, model_latency_ms=None,
+                 seed=None, token_delay_ms=20):
+        self.latency_ms = latency_ms
+        self.token_delay_ms = token_delay_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.model_latency_ms = model_latency_ms or {}
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def update(self, **changes):
+        with self.lock:
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self.requests = 0
+            self.errors = 0
+
+    # Seconds to wait for this model and whether to fail the request
+    def draw(self, model_id):
+        with self.lock:
+            self.requests += 1
+            base = self.model_latency_ms.get(model_id, self.latency_ms) / 1000
+            delay = max(0.0, base * (1 + self.random.uniform(-self.jitter, self.jitter)))
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return delay, fail
+
+def _make_handler(book, settings):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            model_id = payload.get("model", "")
+            messages = payload.get("messages") or [{"content": ""}]
+            question = messages[-1].get("content", "")
+            if len(messages) == 1:
+                # Without a system role the prompt and question arrive as one message, question last
+                question = question.rsplit("\n", 1)[-1]
+            delay, fail = settings.draw(model_id)
+            time.sleep(delay)
+            if fail:
+                self._send(settings.error_status, {"error": {"message": "injected failure"}}, {"Retry-After": "0"})
+                return
+            sql = book.lookup(model_id, question)
+            prompt_chars = sum(len(m.get("content", "")) for m in messages)
+            usage = {"prompt_tokens": prompt_chars // 4, "completion_tokens": max(1, len(sql) // 4)}
+            if payload.get("stream"):
+                self._stream(model_id, sql, usage)
+                return
+            self._send(200, {
+                "id": f"fake-{settings.requests}",
+                "model": model_id,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": sql}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        # Server-sent events like OpenRouter's stream: a keep-alive comment, one chunk per word
+        # token_delay_ms apart, a usage chunk and [DONE]. The connection is closed afterwards.
+        def _stream(self, model_id, sql, usage):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            chunk_id = f"fake-{settings.requests}"
+            try:
+                self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+                for token in re.findall(r"\S+\s*", sql):
+                    self._event({"id": chunk_id, "model": model_id,
+                                 "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+                    time.sleep(settings.token_delay_ms / 1000)
+                self._event({"id": chunk_id, "model": model_id,
+                             "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stops reading once it has a complete statement
+                pass
+
+        def _event(self, body):
+            self.wfile.write(f"data: {json.dumps(body)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up (timed out) before the simulated latency was over
+                self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+# Start the stand-in on a background thread. Returns (server, url of its chat-completions endpoint).
+def start_server(book, settings, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), _make_handler(book, settings))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openrouter", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/api/v1/chat/completions"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve recorded SQL answers on a local OpenRouter-compatible endpoint.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-delay-ms", type=float, default=20, help="Delay between streamed tokens.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    from nl2sql import OPENROUTER_MODELS
+    args = parse_args()
+    book = load_feedback_answers({model["name"]: model["id"] for model in OPENROUTER_MODELS})
+    server, url = start_server(book, FakeSettings(args.latency_ms, error_rate=args.error_rate,
+                                                       token_delay_ms=args.token_delay_ms), port=args.port)
+    print(f"Replaying {len(book.answers)} recorded answers at {url}")
+    print(f"Point the app at it with OPENROUTER_URL={url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
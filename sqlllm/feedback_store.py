@@ -0,0 +1,257 @@
+import os
+import re
+import json
+import zlib
+import queue
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.request import pathname2url
+import pandas as pd
+from metrics import timed
+
+FEEDBACK_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../llm_feedback.db"))
+
+# (run_id, llm_name) pairs whose last written row hash the feedback writer remembers
+FEEDBACK_WRITTEN_CACHE_SIZE = int(os.getenv("FEEDBACK_WRITTEN_CACHE_SIZE", "5000"))
+
+# Structured columns added on top of the original table. llm_output keeps the packed
+# "SQL: ...\nOutput: ..." text for older readers; result_blob holds the typed rows (zlib JSON)
+# and result_text a one-line summary ("120 rows", "(No results)" or the error). The markdown
+# table is built from result_blob only where it is read (see result_markdown).
+STRUCTURED_COLUMNS = [
+    ("generated_sql", "TEXT"),
+    ("result_text", "TEXT"),
+    ("result_blob", "BLOB"),
+    ("latency_ms", "INTEGER"),
+    ("row_count", "INTEGER"),
+    ("model_id", "TEXT"),
+    ("result_fingerprint", "TEXT"),
+]
+
+FEEDBACK_COLUMNS = ["run_id", "user_query", "llm_name", "llm_output", "success", "comments"] + [
+    name for name, _ in STRUCTURED_COLUMNS
+]
+
+# (run_id, llm_name) is covered by the unique index below, which also serves run_id lookups
+FEEDBACK_INDEXES = {
+    "ix_llm_feedback_llm_name": "llm_name",
+    "ix_llm_feedback_timestamp": "timestamp",
+}
+
+_UPDATE_COLUMNS = [col for col in FEEDBACK_COLUMNS if col not in ("run_id", "llm_name")]
+
+# One row per (run_id, llm_name): later feedback for the same run and model updates that row.
+# The WHERE clause skips the write entirely when nothing changed.
+UPSERT_SQL = f"""
+    INSERT INTO llm_feedback ({", ".join(FEEDBACK_COLUMNS)})
+    VALUES ({", ".join(":" + col for col in FEEDBACK_COLUMNS)})
+    ON CONFLICT (run_id, llm_name) DO UPDATE SET
+        {", ".join(f"{col} = excluded.{col}" for col in _UPDATE_COLUMNS)},
+        timestamp = CURRENT_TIMESTAMP
+    WHERE {" OR ".join(f"llm_feedback.{col} IS NOT excluded.{col}" for col in _UPDATE_COLUMNS)}
+"""
+
+# Split the packed llm_output text into (generated_sql, output)
+def parse_llm_output(llm_output):
+    sql_match = re.search(r'SQL:(.*?)Output:', llm_output or "", re.DOTALL)
+    out_match = re.search(r'Output:(.*)', llm_output or "", re.DOTALL)
+    generated_sql = sql_match.group(1).strip() if sql_match else ''
+    output = out_match.group(1).strip() if out_match else llm_output
+    return generated_sql, output
+
+def pack_llm_output(generated_sql, output):
+    return f"SQL: {generated_sql}\nOutput: {output}"
+
+# Compact storage for a result's columns and rows; values JSON can't represent are stored as text
+def encode_result(columns, rows):
+    payload = json.dumps({"columns": list(columns), "rows": [list(row) for row in rows]}, default=str)
+    return zlib.compress(payload.encode("utf-8"))
+
+def decode_result(blob):
+    if blob is None:
+        return None
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+# Markdown table of a stored result with at most max_rows rows and a note for the rest;
+# None when the blob holds no rows
+def result_markdown(blob, max_rows=None):
+    result = decode_result(blob)
+    if not result or not result["rows"]:
+        return None
+    rows = result["rows"] if max_rows is None else result["rows"][:max_rows]
+    text = pd.DataFrame(rows, columns=result["columns"]).to_markdown(index=False)
+    if len(result["rows"]) > len(rows):
+        text += f"\n... {len(result['rows']) - len(rows)} more rows not shown"
+    return text
+
+# Table, structured columns and lookup indexes. Safe on a database that still has duplicate
+# (run_id, llm_name) rows; migrate_llm_feedback.py uses it before archiving them.
+def ensure_columns(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT,
+            user_query TEXT NOT NULL,
+            llm_name TEXT NOT NULL,
+            llm_output TEXT NOT NULL,
+            success BOOLEAN NOT NULL,
+            comments TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(llm_feedback)")]
+    for name, col_type in [("run_id", "TEXT")] + STRUCTURED_COLUMNS:
+        if name not in columns:
+            conn.execute(f"ALTER TABLE llm_feedback ADD COLUMN {name} {col_type}")
+    for index_name, column in FEEDBACK_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON llm_feedback ({column})")
+    conn.commit()
+
+# Full schema for writers, including the unique index UPSERT_SQL needs. Earlier versions inserted
+# a new row on every Streamlit rerun; those duplicates are only archived and removed by
+# migrate_llm_feedback.py, so until it has run this raises instead of letting every upsert fail.
+def ensure_schema(conn):
+    ensure_columns(conn)
+    try:
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_llm_feedback_run_llm ON llm_feedback (run_id, llm_name)")
+        conn.commit()
+    except sqlite3.IntegrityError as e:
+        raise RuntimeError(
+            "llm_feedback has duplicate (run_id, llm_name) rows from an older version; "
+            "run migrate_llm_feedback.py to archive them before feedback can be saved."
+        ) from e
+
+def connect(db_path=FEEDBACK_DB_PATH):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    ensure_schema(conn)
+    return conn
+
+# Read-only connection for exporters and reports: never creates or alters anything
+def connect_readonly(db_path=FEEDBACK_DB_PATH):
+    uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+# Upsert a batch of feedback rows in one transaction
+def upsert_feedback(conn, rows):
+    with conn:
+        conn.executemany(UPSERT_SQL, rows)
+
+def fetch_run_feedback(run_id, db_path=FEEDBACK_DB_PATH):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(
+            "SELECT id, run_id, user_query, llm_name, generated_sql, COALESCE(result_text, llm_output), "
+            "success, comments, timestamp, latency_ms, row_count, result_fingerprint, result_blob "
+            "FROM llm_feedback WHERE run_id = ? ORDER BY id DESC",
+            (run_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+# Digest of a feedback row, so the writer can skip unchanged rows without keeping them
+def row_digest(row):
+    digest = hashlib.blake2b(digest_size=16)
+    for col in FEEDBACK_COLUMNS:
+        value = row.get(col)
+        digest.update(value if isinstance(value, bytes) else repr(value).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.digest()
+
+# Write-behind queue for feedback. submit() returns immediately; a background thread coalesces
+# pending rows by (run_id, llm_name), drops rows identical to what it last wrote (remembered as
+# digests in a bounded LRU) and upserts the rest in one transaction. flush() blocks until
+# everything submitted so far was handled and raises the first error those writes hit (including
+# a database that still needs migrate_llm_feedback.py).
+class FeedbackWriter:
+    def __init__(self, db_path=FEEDBACK_DB_PATH, cache_size=FEEDBACK_WRITTEN_CACHE_SIZE):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._queue = queue.Queue()
+        self._written = OrderedDict()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_skipped = 0
+        self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, rows):
+        rows = [{col: row.get(col) for col in FEEDBACK_COLUMNS} for row in rows if row.get("run_id")]
+        if rows:
+            self._queue.put(rows)
+
+    # True once every row submitted so far is written, False on timeout
+    def flush(self, timeout=None):
+        done = threading.Event()
+        done.error = None
+        self._queue.put(done)
+        if not done.wait(timeout):
+            return False
+        if done.error is not None:
+            raise done.error
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {"batches": self.batches, "rows_written": self.rows_written, "rows_skipped": self.rows_skipped}
+
+    def _run(self):
+        conn = None
+        error = None
+        while True:
+            items = [self._queue.get()]
+            # Drain whatever else is waiting so a burst of reruns becomes a single batch
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            pending = {}
+            events = []
+            for item in items:
+                if isinstance(item, threading.Event):
+                    events.append(item)
+                    continue
+                for row in item:
+                    pending[(row["run_id"], row["llm_name"])] = row
+            digests = {key: row_digest(row) for key, row in pending.items()}
+            changed = [row for key, row in pending.items() if self._written.get(key) != digests[key]]
+            try:
+                if changed and conn is None:
+                    conn = connect(self.db_path)
+                if changed:
+                    with timed("feedback_write", rows=len(changed)):
+                        upsert_feedback(conn, changed)
+                for key, digest in digests.items():
+                    self._written[key] = digest
+                    self._written.move_to_end(key)
+                while len(self._written) > self.cache_size:
+                    self._written.popitem(last=False)
+                with self._lock:
+                    self.batches += 1 if changed else 0
+                    self.rows_written += len(changed)
+                    self.rows_skipped += len(pending) - len(changed)
+            except (sqlite3.Error, RuntimeError) as e:
+                print(f"Failed to write feedback: {e}")
+                error = error or e
+            # The first failure since the last flush is reported to every flush waiting now
+            for event in events:
+                event.error = error
+                event.set()
+            if events:
+                error = None
+
+_writer = None
+_writer_lock = threading.Lock()
+
+# One writer per process, shared by every Streamlit session
+def get_feedback_writer(db_path=FEEDBACK_DB_PATH):
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = FeedbackWriter(db_path)
+        return _writer
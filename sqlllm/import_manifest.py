@@ -0,0 +1,95 @@
+import os
+import datetime
+import pandas as pd
+from db_utils import quote_identifier, table_exists, swap_table
+from bulk_load import CHUNK_SIZE, bulk_load_frames, create_indexes, csv_dtypes
+from snapshot_cache import file_sha256, has_snapshot, iter_snapshot_frames, tee_to_snapshot
+
+# Per-file record of what was last imported, stored in sales_data.db next to the tables it describes
+MANIFEST_TABLE = "import_manifest"
+
+def ensure_manifest(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            source_file TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            row_count INTEGER NOT NULL,
+            imported_at TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+
+def get_manifest(conn):
+    rows = conn.execute(
+        f"SELECT source_file, table_name, sha256, size, mtime, row_count, imported_at FROM {MANIFEST_TABLE}"
+    ).fetchall()
+    keys = ["source_file", "table_name", "sha256", "size", "mtime", "row_count", "imported_at"]
+    return {row[0]: dict(zip(keys, row)) for row in rows}
+
+# Decide whether a CSV has to be re-imported. Size and mtime are checked first; the file is only
+# hashed when they differ, and a touched-but-identical file just gets its mtime refreshed.
+# Returns (changed, sha256 or None).
+def check_file(conn, csv_path, table_name, entry):
+    st = os.stat(csv_path)
+    if entry is None or entry["table_name"] != table_name or not table_exists(conn, table_name):
+        return True, None
+    if entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+        return False, entry["sha256"]
+    sha = file_sha256(csv_path)
+    if sha == entry["sha256"]:
+        conn.execute(
+            f"UPDATE {MANIFEST_TABLE} SET size = ?, mtime = ? WHERE source_file = ?",
+            (st.st_size, st.st_mtime, entry["source_file"])
+        )
+        conn.commit()
+        return False, sha
+    return True, sha
+
+# Load a CSV into a staging table, then swap it in and record it in the manifest in one transaction.
+# Pre-parsed batches (e.g. from parallel workers) can be passed as frames together with their dtypes.
+# A columnar snapshot matching the file hash is read instead of the CSV; otherwise one is written
+# while the CSV is loaded.
+def import_csv(conn, csv_path, table_name, sha=None, clean_columns=True, frames=None, dtypes=None):
+    source_file = os.path.basename(csv_path)
+    st = os.stat(csv_path)
+    sha = sha or file_sha256(csv_path)
+    staging = f"{table_name}__staging"
+    dtypes = dtypes or csv_dtypes(csv_path)
+    if frames is None and has_snapshot(csv_path, sha):
+        frames = iter_snapshot_frames(csv_path, sha, dtypes)
+        source_file_note = f"{source_file} (snapshot)"
+    else:
+        if frames is None:
+            frames = pd.read_csv(csv_path, encoding="utf-8-sig", dtype=dtypes, chunksize=CHUNK_SIZE)
+        frames = tee_to_snapshot(csv_path, sha, frames)
+        source_file_note = source_file
+    stats = bulk_load_frames(conn, staging, frames, dtypes, create=True, clean_columns=clean_columns,
+                             build_indexes=False, source=source_file_note)
+
+    def finish(conn):
+        create_indexes(conn, table_name, stats["columns"], commit=False)
+        conn.execute(
+            f"""
+            INSERT OR REPLACE INTO {MANIFEST_TABLE}
+                (source_file, table_name, sha256, size, mtime, row_count, imported_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (source_file, table_name, sha, st.st_size, st.st_mtime, stats["rows"],
+             datetime.datetime.now().isoformat(timespec="seconds"))
+        )
+
+    swap_table(conn, staging, table_name, finish)
+    return stats
+
+# Drop tables whose source CSV no longer exists
+def drop_removed(conn, manifest, present_files):
+    removed = [entry for name, entry in manifest.items() if name not in present_files]
+    for entry in removed:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(entry['table_name'])}")
+        conn.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE source_file = ?", (entry["source_file"],))
+        print(f"Dropped {entry['table_name']}: {entry['source_file']} was removed.")
+    conn.commit()
+    return removed
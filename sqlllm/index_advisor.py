@@ -0,0 +1,337 @@
+import os
+import re
+import json
+import sqlite3
+import argparse
+import datetime
+from collections import Counter
+from db_utils import quote_identifier, table_exists
+
+DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../sales_data.db"))
+
+# Indexes created from the advice, kept in the sales db so loaders can rebuild them after a reload
+ADVISOR_TABLE = "advised_indexes"
+# Times a candidate index must be suggested across the feedback history before it is proposed
+ADVISOR_MIN_HITS = int(os.getenv("INDEX_ADVISOR_MIN_HITS", "3"))
+# Wider candidates are cut to their key columns instead of being made covering
+MAX_INDEX_COLUMNS = 4
+
+_NAME = r'\[[^\]]+\]|"(?:[^"]|"")+"|`[^`]+`|[A-Za-z_][A-Za-z0-9_]*'
+_TABLE_RE = re.compile(rf"\b(?:FROM|JOIN)\s+({_NAME})(?:\s+(?:AS\s+)?({_NAME}))?", re.IGNORECASE)
+_KEYWORDS = {
+    "where", "join", "inner", "left", "right", "full", "cross", "outer", "natural", "on", "using", "group",
+    "order", "limit", "having", "union", "except", "intersect", "window", "as", "select", "from", "set",
+}
+_EQ_OPS = r"(?:==?|\bIN\b|\bIS\b)"
+# A constant or parameter on the other side of a comparison
+_LITERAL = r"(?:'|-?\d|\?|:\w|\(|NULL\b)"
+_RANGE_OPS = r"(?:<=|>=|<>|!=|<|>|\bBETWEEN\b|\bLIKE\b|\bGLOB\b)"
+_CLAUSE_RE = r"\b{}\s+BY\b(.*?)(?=\bHAVING\b|\bORDER\s+BY\b|\bLIMIT\b|\bWINDOW\b|\bUNION\b|\)|;|$)"
+
+def _unquote(name):
+    if name[0] in '["`':
+        return name[1:-1].replace('""', '"')
+    return name
+
+# {alias or table name as it appears in plans: table} for the tables the query reads
+def table_aliases(sql):
+    aliases = {}
+    for match in _TABLE_RE.finditer(sql):
+        table = _unquote(match.group(1))
+        alias = match.group(2)
+        if alias and alias.lower() not in _KEYWORDS:
+            aliases[_unquote(alias)] = table
+        aliases.setdefault(table, table)
+    return aliases
+
+# One step of EXPLAIN QUERY PLAN, classified: full scans, index searches and temp B-trees
+def parse_plan_step(detail, aliases):
+    words = detail.split()
+    if words[0] in ("SCAN", "SEARCH") and len(words) > 1:
+        table = aliases.get(words[1].lower())
+        if table is None:
+            # Subqueries, CTEs and constant rows are not tables
+            return {"kind": "other", "detail": detail}
+        if "AUTOMATIC" in detail:
+            # SQLite built a throwaway index for this query: the columns it used are the ones to index
+            columns = re.findall(r"(\w+)(?:=|>|<)", detail[detail.rfind("("):])
+            return {"kind": "automatic_index", "table": table, "columns": columns, "detail": detail}
+        if words[0] == "SCAN":
+            kind = "full_scan" if "USING" not in detail else "index_scan"
+            return {"kind": kind, "table": table, "detail": detail}
+        return {"kind": "search", "table": table, "detail": detail}
+    if detail.startswith("USE TEMP B-TREE"):
+        return {"kind": "temp_btree", "purpose": detail.split(" FOR ", 1)[-1], "detail": detail}
+    return {"kind": "other", "detail": detail}
+
+def explain(conn, sql):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+# Rows a full scan of each table reads; MAX(rowid) is answered from the b-tree without scanning
+def table_rows(conn, table):
+    try:
+        return conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(table)}").fetchone()[0] or 0
+    except sqlite3.Error:
+        return None
+
+# Plan of one statement with a rough cost: the rows read by scans of whole tables or indexes.
+# Index searches are counted as free, so the number says how far the query is from using indexes.
+def analyze_sql(conn, sql):
+    tables = {row[0].lower(): row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    # Names are matched case-insensitively, like SQLite does; CTEs and subquery aliases are dropped
+    aliases = {
+        alias.lower(): tables[table.lower()] for alias, table in table_aliases(sql).items() if table.lower() in tables
+    }
+    steps = [parse_plan_step(detail, aliases) for detail in explain(conn, sql)]
+    scanned = {step["table"] for step in steps if step["kind"] in ("full_scan", "index_scan", "automatic_index")}
+    sizes = {table: table_rows(conn, table) for table in scanned}
+    return {
+        "steps": [step["detail"] for step in steps],
+        "full_scans": sorted(step["table"] for step in steps if step["kind"] == "full_scan"),
+        "index_scans": sorted(step["table"] for step in steps if step["kind"] == "index_scan"),
+        "temp_btrees": [step["purpose"] for step in steps if step["kind"] == "temp_btree"],
+        "automatic_indexes": [(step["table"], step["columns"]) for step in steps if step["kind"] == "automatic_index"],
+        "scanned_rows": sum(size or 0 for size in sizes.values()),
+        "table_rows": sizes,
+        "parsed": steps,
+        "aliases": aliases,
+    }
+
+# One line for the UI, e.g. "full scan of Sales_Data (~120,000 rows); temp B-tree for GROUP BY"
+def describe_plan(plan):
+    if plan is None:
+        return "not available"
+    parts = [f"full scan of {table} (~{plan['table_rows'].get(table) or 0:,} rows)" for table in plan["full_scans"]]
+    parts += [f"full index scan of {table} (~{plan['table_rows'].get(table) or 0:,} rows)"
+              for table in plan["index_scans"]]
+    parts += [f"automatic index on {table} ({', '.join(columns)})" for table, columns in plan["automatic_indexes"]]
+    parts += [f"temp B-tree for {purpose}" for purpose in plan["temp_btrees"]]
+    return "; ".join(parts) or "index lookups only"
+
+def _columns_of(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+
+# Columns of table referenced in sql, split by role: equality with a constant, equality joins, range
+# predicates, GROUP BY / ORDER BY keys and everything else (select list, aggregates)
+def column_roles(sql, table, names, columns):
+    refs = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    roles = {"const": [], "eq": [], "range": [], "group": [], "order": [], "other": []}
+    for column in sorted(columns, key=len, reverse=True):
+        quoted = rf'(?:\[{re.escape(column)}\]|"{re.escape(column)}"|\b{re.escape(column)}\b)'
+        ref = rf"(?:(?:\b(?:{refs})|\[(?:{refs})\])\s*\.\s*)?{quoted}"
+        if not re.search(ref, sql, re.IGNORECASE):
+            continue
+        if re.search(rf"{ref}\s*{_EQ_OPS}\s*{_LITERAL}|{_LITERAL}\s*=\s*{ref}", sql, re.IGNORECASE):
+            roles["const"].append(column)
+        elif re.search(rf"{ref}\s*{_EQ_OPS}|=\s*{ref}", sql, re.IGNORECASE):
+            roles["eq"].append(column)
+        elif re.search(rf"{ref}\s*{_RANGE_OPS}|(?:<|>)=?\s*{ref}", sql, re.IGNORECASE):
+            roles["range"].append(column)
+        elif any(re.search(ref, clause, re.IGNORECASE)
+                 for clause in re.findall(_CLAUSE_RE.format("GROUP"), sql, re.IGNORECASE | re.DOTALL)):
+            roles["group"].append(column)
+        elif any(re.search(ref, clause, re.IGNORECASE)
+                 for clause in re.findall(_CLAUSE_RE.format("ORDER"), sql, re.IGNORECASE | re.DOTALL)):
+            roles["order"].append(column)
+        else:
+            roles["other"].append(column)
+    order = {column.lower(): sql.lower().find(column.lower()) for column in columns}
+    return {role: sorted(cols, key=lambda c: order[c.lower()]) for role, cols in roles.items()}
+
+# Index candidates for the tables a plan scans: columns compared with constants, join columns, one
+# range column (or the GROUP BY keys when SQLite sorted for them), then the other referenced columns
+# to make it covering
+def suggest_indexes(conn, sql, plan):
+    suggestions = []
+    scanned = {step["table"] for step in plan["parsed"] if step["kind"] in ("full_scan", "automatic_index")}
+    sorts = plan["temp_btrees"]
+    names_by_table = {}
+    for name, table in plan["aliases"].items():
+        names_by_table.setdefault(table, set()).add(name)
+    for table, names in names_by_table.items():
+        grouped = any("GROUP BY" in purpose for purpose in sorts)
+        if table not in scanned and not grouped:
+            continue
+        columns = _columns_of(conn, table)
+        if not columns:
+            continue
+        roles = column_roles(sql, table, names, columns)
+        # A table that is already searched through an index only gets a candidate for its GROUP BY keys
+        if table not in scanned and not roles["group"]:
+            continue
+        key = roles["const"] + roles["eq"] + roles["range"][:1]
+        if not key and grouped:
+            key = roles["group"]
+        if not key:
+            continue
+        rest = [c for c in roles["range"][1:] + roles["group"] + roles["order"] + roles["other"] if c not in key]
+        selects_all = re.search(r"\bSELECT\s+(?:DISTINCT\s+)?(?:\w+\.)?\*", sql, re.IGNORECASE)
+        if not selects_all and len(key) + len(rest) <= MAX_INDEX_COLUMNS:
+            key = key + rest
+        suggestions.append((table, tuple(key[:MAX_INDEX_COLUMNS])))
+    return suggestions
+
+# Leading columns of every index on table, to skip candidates an existing index already serves
+def existing_indexes(conn, table):
+    indexes = []
+    for row in conn.execute(f"PRAGMA index_list({quote_identifier(table)})"):
+        columns = [info[2] for info in conn.execute(f"PRAGMA index_info({quote_identifier(row[1])})")]
+        indexes.append(tuple(columns))
+    return indexes
+
+def _is_served(candidate, indexes):
+    return any(index[:len(candidate)] == candidate for index in indexes)
+
+# Explain every statement (with its weight, e.g. how often it was generated) and aggregate what the
+# plans show: full scans per table, temp B-trees per purpose and candidate indexes with their hits
+def advise(conn, statements):
+    scans = Counter()
+    sorts = Counter()
+    candidates = Counter()
+    examples = {}
+    failed = 0
+    for sql, weight in statements:
+        try:
+            plan = analyze_sql(conn, sql)
+        except sqlite3.Error:
+            failed += weight
+            continue
+        for table in plan["full_scans"]:
+            scans[table] += weight
+        for purpose in plan["temp_btrees"]:
+            sorts[purpose] += weight
+        for candidate in suggest_indexes(conn, sql, plan):
+            if not _is_served(candidate[1], existing_indexes(conn, candidate[0])):
+                candidates[candidate] += weight
+                examples.setdefault(candidate, sql)
+    return {"scans": scans, "temp_btrees": sorts, "candidates": candidates, "examples": examples, "failed": failed}
+
+def index_name(table, columns):
+    name = "adv_" + "_".join([table] + list(columns))
+    return re.sub(r"\W", "_", name)[:120]
+
+def ensure_advisor_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ADVISOR_TABLE} (
+            index_name TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            columns TEXT NOT NULL,
+            hits INTEGER,
+            created_at TEXT
+        )
+    """)
+
+# Create the proposed indexes and remember them so create_advised_indexes rebuilds them after loads
+def apply_advice(conn, candidates):
+    ensure_advisor_table(conn)
+    created = []
+    for (table, columns), hits in candidates:
+        name = index_name(table, columns)
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote_identifier(name)} ON {quote_identifier(table)} "
+            f"({', '.join(quote_identifier(c) for c in columns)})"
+        )
+        conn.execute(
+            f"INSERT OR REPLACE INTO {ADVISOR_TABLE} (index_name, table_name, columns, hits, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (name, table, json.dumps(list(columns)), hits, datetime.datetime.now().isoformat(timespec="seconds"))
+        )
+        created.append(name)
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+    return created
+
+# Rebuild the advised indexes, e.g. after a loader replaced their tables. Indexes whose table or
+# columns no longer exist are skipped until a load brings them back.
+def create_advised_indexes(conn, commit=True):
+    if not table_exists(conn, ADVISOR_TABLE):
+        return []
+    created = []
+    for name, table, columns in conn.execute(f"SELECT index_name, table_name, columns FROM {ADVISOR_TABLE}").fetchall():
+        columns = json.loads(columns)
+        if not table_exists(conn, table) or not set(columns) <= set(_columns_of(conn, table)):
+            continue
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote_identifier(name)} ON {quote_identifier(table)} "
+            f"({', '.join(quote_identifier(c) for c in columns)})"
+        )
+        created.append(name)
+    if commit:
+        conn.commit()
+    return created
+
+def drop_advised_index(conn, name):
+    conn.execute(f"DROP INDEX IF EXISTS {quote_identifier(name)}")
+    if table_exists(conn, ADVISOR_TABLE):
+        conn.execute(f"DELETE FROM {ADVISOR_TABLE} WHERE index_name = ?", (name,))
+    conn.commit()
+
+# Generated SQL from the feedback history, weighted by how often it was generated
+def feedback_statements(feedback_db):
+    from feedback_store import connect_readonly
+    from sql_result_cache import canonicalize_sql
+    conn = connect_readonly(feedback_db)
+    try:
+        rows = conn.execute(
+            "SELECT generated_sql, COUNT(*) FROM llm_feedback "
+            "WHERE generated_sql IS NOT NULL AND generated_sql != '' AND generated_sql NOT LIKE 'Error%' "
+            "GROUP BY generated_sql"
+        ).fetchall()
+    finally:
+        conn.close()
+    weights = Counter()
+    for sql, count in rows:
+        weights[canonicalize_sql(sql)] += count
+    return list(weights.items())
+
+def print_report(report, min_hits):
+    print("Full scans by table:")
+    for table, count in report["scans"].most_common():
+        print(f"  {table}: {count}")
+    print("Temp B-trees:")
+    for purpose, count in report["temp_btrees"].most_common():
+        print(f"  {purpose}: {count}")
+    print(f"Index candidates (proposed at {min_hits}+ hits):")
+    for (table, columns), hits in report["candidates"].most_common():
+        mark = "*" if hits >= min_hits else " "
+        print(f" {mark} {hits:5d}  CREATE INDEX {index_name(table, columns)} ON {table} ({', '.join(columns)})")
+        print(f"         e.g. {report['examples'][(table, columns)][:160]}")
+    if report["failed"]:
+        print(f"{report['failed']} statement(s) could not be explained (invalid SQL or missing tables).")
+
+def parse_args():
+    from feedback_store import FEEDBACK_DB_PATH
+    parser = argparse.ArgumentParser(
+        description="Explain the generated SQL in llm_feedback.db and propose indexes for the scans it causes."
+    )
+    parser.add_argument("--db", default=DB_PATH, help="Database the generated SQL runs against.")
+    parser.add_argument("--feedback-db", default=FEEDBACK_DB_PATH)
+    parser.add_argument("--min-hits", type=int, default=ADVISOR_MIN_HITS)
+    parser.add_argument("--apply", action="store_true", help="Create the proposed indexes.")
+    parser.add_argument("--drop", metavar="INDEX", action="append", help="Drop an advised index. Repeatable.")
+    parser.add_argument("--list", action="store_true", help="List the advised indexes that exist.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.drop:
+            for name in args.drop:
+                drop_advised_index(conn, name)
+                print(f"Dropped {name}")
+        elif args.list:
+            ensure_advisor_table(conn)
+            for row in conn.execute(f"SELECT index_name, table_name, columns, hits, created_at FROM {ADVISOR_TABLE}"):
+                print(*row, sep="  ")
+        else:
+            report = advise(conn, feedback_statements(args.feedback_db))
+            print_report(report, args.min_hits)
+            proposed = [(c, hits) for c, hits in report["candidates"].most_common() if hits >= args.min_hits]
+            if args.apply and proposed:
+                for name in apply_advice(conn, proposed):
+                    print(f"Created {name}")
+            elif proposed:
+                print("Run with --apply to create the proposed (*) indexes.")
+    finally:
+        conn.close()
@@ -1,6 +1,9 @@
-import pandas as pd
 import sqlite3
 import os
+from bulk_load import bulk_load_csv
+from weekly_sales import rebuild_weekly_sales
+from rollups import refresh_rollups
+from index_advisor import create_advised_indexes
 
 # Database path
 DB_PATH = os.path.join(os.path.dirname(__file__), '../sales_data.db')
@@ -16,11 +19,8 @@ CSV_FILES = {
 }
 
 def load_csv_to_table(conn, table_name, csv_path):
-    df = pd.read_csv(csv_path)
-    # Overwrite: delete existing data
-    conn.execute(f"DELETE FROM {table_name}")
-    df.to_sql(table_name, conn, if_exists='append', index=False)
-    print(f"Loaded {len(df)} rows into {table_name} from {os.path.basename(csv_path)}.")
+    # Overwrite: existing rows are replaced inside one chunked, typed transaction
+    return bulk_load_csv(conn, table_name, csv_path, create=False)
 
 def main():
     conn = sqlite3.connect(DB_PATH)
@@ -32,6 +32,13 @@ def main():
             else:
                 print(f"CSV file not found: {csv_path}")
         conn.commit()
+        # Long-format weekly fact table derived from the wide bucket columns
+        sales_csv = os.path.join(DATA_DIR, CSV_FILES['sales_data_table'])
+        bckt_csv = os.path.join(DATA_DIR, CSV_FILES['Bckt_To_Week'])
+        if os.path.exists(sales_csv) and os.path.exists(bckt_csv):
+            rebuild_weekly_sales(conn, sales_csv, bckt_csv)
+            refresh_rollups(conn, 'Presc_Territory_Table', 'Product_Data_Table')
+        create_advised_indexes(conn)
     finally:
         conn.close()
 
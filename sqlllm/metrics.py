@@ -0,0 +1,150 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+import pandas as pd
+
+METRICS_DB_PATH = os.path.abspath(os.getenv(
+    "METRICS_DB_PATH", os.path.join(os.path.dirname(__file__), "../llm_metrics.db")
+))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+# Buffered measurements are written at least this often, or sooner once the buffer fills up
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "2"))
+METRICS_FLUSH_ROWS = 200
+
+# Stages of one model's answer, in pipeline order; llm_ttft is the time to the first streamed token
+STAGES = ["llm_ttft", "llm", "sql", "render", "feedback_write"]
+
+METRIC_COLUMNS = ["ts", "stage", "model_id", "seconds", "status", "rows", "prompt_tokens",
+                  "completion_tokens", "cached", "error"]
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_wakeup = threading.Event()
+_flushed = threading.Condition(_buffer_lock)
+_counts = {"recorded": 0, "written": 0}
+_writer = None
+
+def ensure_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            stage TEXT NOT NULL,
+            model_id TEXT,
+            seconds REAL NOT NULL,
+            status INTEGER,
+            rows INTEGER,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            cached INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_metrics_ts ON llm_metrics (ts)")
+    conn.commit()
+
+def connect(db_path=METRICS_DB_PATH):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    ensure_schema(conn)
+    return conn
+
+# Queue one measurement. Only appends to a list, so it is cheap enough for the hot path;
+# a background thread writes the buffer in batches.
+def record(stage, seconds, model_id=None, status=None, rows=None, prompt_tokens=None,
+           completion_tokens=None, cached=False, error=None):
+    if not METRICS_ENABLED:
+        return
+    _ensure_writer()
+    row = (time.time(), stage, model_id, seconds, status, rows, prompt_tokens, completion_tokens,
+           int(bool(cached)), error)
+    with _buffer_lock:
+        _buffer.append(row)
+        _counts["recorded"] += 1
+        full = len(_buffer) >= METRICS_FLUSH_ROWS
+    if full:
+        _wakeup.set()
+
+# Time a block and record it; fields set on the yielded dict (rows, status, ...) are recorded too
+@contextmanager
+def timed(stage, model_id=None, **fields):
+    start = time.perf_counter()
+    try:
+        yield fields
+    except Exception as e:
+        fields.setdefault("error", str(e))
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, model_id, **fields)
+
+# Block until everything recorded so far is in the database
+def flush(timeout=5):
+    if _writer is None:
+        return True
+    with _flushed:
+        target = _counts["recorded"]
+        _wakeup.set()
+        return _flushed.wait_for(lambda: _counts["written"] >= target, timeout)
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _buffer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_run, name="metrics-writer", daemon=True)
+                _writer.start()
+
+def _run():
+    conn = connect()
+    while True:
+        _wakeup.wait(METRICS_FLUSH_SECONDS)
+        _wakeup.clear()
+        with _buffer_lock:
+            rows = _buffer[:]
+            _buffer.clear()
+        if rows:
+            try:
+                with conn:
+                    conn.executemany(
+                        f"INSERT INTO llm_metrics ({', '.join(METRIC_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in METRIC_COLUMNS)})",
+                        rows
+                    )
+            except sqlite3.Error as e:
+                print(f"Failed to write metrics: {e}")
+        with _flushed:
+            _counts["written"] += len(rows)
+            _flushed.notify_all()
+
+# Measurements since a unix timestamp, for the dashboard
+def load_metrics(since=0, db_path=METRICS_DB_PATH):
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query(
+            f"SELECT {', '.join(METRIC_COLUMNS)} FROM llm_metrics WHERE ts >= ? ORDER BY ts",
+            conn, params=(since,)
+        )
+    finally:
+        conn.close()
+
+# p50/p95 seconds, call and error counts and average token usage per stage and model
+def summarize(df):
+    if df.empty:
+        return pd.DataFrame(columns=["stage", "model_id", "calls", "p50_s", "p95_s", "errors", "avg_prompt_tokens",
+                                     "avg_completion_tokens"])
+    grouped = df.assign(model_id=df["model_id"].fillna("-"), failed=df["error"].notna()).groupby(
+        ["stage", "model_id"]
+    )
+    summary = grouped.agg(
+        calls=("seconds", "size"),
+        p50_s=("seconds", lambda s: s.quantile(0.5)),
+        p95_s=("seconds", lambda s: s.quantile(0.95)),
+        errors=("failed", "sum"),
+        avg_prompt_tokens=("prompt_tokens", "mean"),
+        avg_completion_tokens=("completion_tokens", "mean"),
+    ).reset_index()
+    summary["stage"] = pd.Categorical(summary["stage"], categories=STAGES + sorted(set(summary["stage"]) - set(STAGES)))
+    return summary.sort_values(["stage", "p50_s"]).reset_index(drop=True)
@@ -0,0 +1,107 @@
+import re
+import argparse
+import sqlite3
+from feedback_store import FEEDBACK_DB_PATH, ensure_columns, ensure_schema, parse_llm_output
+from nl2sql import OPENROUTER_MODELS
+
+# Rows rewritten per transaction
+BATCH_SIZE = 1000
+
+# Model ids for rows stored before model_id existed, keyed by the display name in llm_name
+MODEL_IDS = {model["name"]: model["id"] for model in OPENROUTER_MODELS}
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Archive duplicate llm_feedback rows and split the packed llm_output of existing rows "
+                    "into the structured columns."
+    )
+    parser.add_argument("--db", default=FEEDBACK_DB_PATH, help="Path to llm_feedback.db.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    return parser.parse_args()
+
+# Row count of a stored markdown result: the full count from a truncation note if present,
+# otherwise the table lines minus header and separator. None for errors.
+def count_result_rows(output):
+    if not output or output.startswith("Error"):
+        return None
+    if output.startswith("(No results)"):
+        return 0
+    total = re.search(r"truncated after \d+ rows of (\d+)\)", output)
+    if total:
+        return int(total.group(1))
+    table_lines = [line for line in output.splitlines() if line.startswith("|")]
+    return max(len(table_lines) - 2, 0) if table_lines else None
+
+# Rows removed as duplicates are copied here first, with the same columns as llm_feedback
+ARCHIVE_TABLE = "llm_feedback_archive"
+
+# Earlier versions inserted a new row on every Streamlit rerun. Copy every row but the latest per
+# (run_id, llm_name) to the archive table, delete them and create the unique index the upsert needs,
+# all in one transaction. Returns the number of rows archived.
+def archive_duplicates(conn):
+    if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_llm_feedback_run_llm'"
+    ).fetchone():
+        return 0
+    duplicates = """
+        SELECT id FROM llm_feedback
+        WHERE run_id IS NOT NULL AND id NOT IN (
+            SELECT MAX(id) FROM llm_feedback WHERE run_id IS NOT NULL GROUP BY run_id, llm_name
+        )
+    """
+    with conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} AS SELECT * FROM llm_feedback WHERE 0")
+        archive_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({ARCHIVE_TABLE})")}
+        columns = ", ".join(
+            row[1] for row in conn.execute("PRAGMA table_info(llm_feedback)") if row[1] in archive_columns
+        )
+        archived = conn.execute(
+            f"INSERT INTO {ARCHIVE_TABLE} ({columns}) SELECT {columns} FROM llm_feedback WHERE id IN ({duplicates})"
+        ).rowcount
+        conn.execute(f"DELETE FROM llm_feedback WHERE id IN ({duplicates})")
+        conn.execute("CREATE UNIQUE INDEX ux_llm_feedback_run_llm ON llm_feedback (run_id, llm_name)")
+    return archived
+
+# Rewrite rows that have not been migrated yet (generated_sql IS NULL) in id order, one
+# transaction per batch, so the script can be interrupted and re-run safely.
+def migrate(db_path=FEEDBACK_DB_PATH, batch_size=BATCH_SIZE):
+    # Not feedback_store.connect: that requires the unique index, which is created here
+    conn = sqlite3.connect(db_path)
+    migrated = 0
+    last_id = 0
+    try:
+        ensure_columns(conn)
+        archived = archive_duplicates(conn)
+        if archived:
+            print(f"Archived {archived} duplicate rows to {ARCHIVE_TABLE}")
+        ensure_schema(conn)
+        while True:
+            rows = conn.execute(
+                "SELECT id, llm_name, llm_output, model_id FROM llm_feedback "
+                "WHERE generated_sql IS NULL AND id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row_id, llm_name, llm_output, model_id in rows:
+                generated_sql, output = parse_llm_output(llm_output)
+                updates.append((generated_sql, output, count_result_rows(output),
+                                model_id or MODEL_IDS.get(llm_name), row_id))
+            with conn:
+                conn.executemany(
+                    "UPDATE llm_feedback SET generated_sql = ?, result_text = ?, row_count = ?, model_id = ? "
+                    "WHERE id = ?",
+                    updates
+                )
+            migrated += len(rows)
+            last_id = rows[-1][0]
+            print(f"Migrated {migrated} rows (up to id {last_id})")
+    finally:
+        conn.close()
+    return migrated
+
+if __name__ == "__main__":
+    args = parse_args()
+    total = migrate(args.db, args.batch_size)
+    print(f"Migration complete: {total} rows rewritten.")
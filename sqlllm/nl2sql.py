@@ -0,0 +1,401 @@
+import os
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+load_dotenv()
+import requests
+import threading
+from openrouter_client import READ_TIMEOUT, post_chat_completion, iter_sse_events
+from response_cache import get_cached_response, put_cached_response
+from sql_result_cache import canonicalize_sql, strip_fences, is_complete_statement, result_cache
+from db_pool import get_pool
+from metrics import record, timed
+from result_fingerprint import Fingerprint
+from index_advisor import analyze_sql
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../sales_data.db"))
+
+# Concurrency settings for the "Compare Across LLMs" flow
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "6"))
+LLM_MODEL_TIMEOUT = float(os.getenv("LLM_MODEL_TIMEOUT", "90"))
+
+# Limits for executing generated SQL: rows kept for display and wall-clock seconds per query
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "1000"))
+SQL_TIMEOUT = float(os.getenv("SQL_TIMEOUT", "30"))
+SQL_FETCH_SIZE = 500
+
+# Define the models to compare (OpenRouter model IDs)
+OPENROUTER_MODELS = [
+    {"name": "Claude 3 Sonnet", "id": "anthropic/claude-3-sonnet"},
+    {"name": "Gemini 1.5 Flash", "id": "google/gemini-flash-1.5"},
+    {"name": "GPT-4o", "id": "openai/gpt-4o"},
+    {"name": "O1-mini", "id": "openai/o1-mini"},
+    {"name": "O4-mini", "id": "openai/o4-mini"},
+    {"name": "Qwen 3 (reasoning)", "id": "qwen/qwen3-coder:free"}
+]
+
+# Chat-completions payload for one model; some models do not accept a system message
+def _chat_payload(question, prompt, model_id):
+    # Models that do NOT support 'system' role
+    no_system_role_models = [
+        "qwen/qwen-110b-chat",
+        # Add more model IDs here if needed
+    ]
+    if model_id in no_system_role_models:
+        # Combine prompt and question as a single user message
+        messages = [
+            {"role": "user", "content": prompt[0] + "\n" + question}
+        ]
+    else:
+        messages = [
+            {"role": "system", "content": prompt[0]},
+            {"role": "user", "content": question}
+        ]
+    data = {
+        "model": model_id,
+        "messages": messages,
+        "max_tokens": 256,
+        "temperature": 0
+    }
+    return data
+
+# Function to get SQL query from OpenRouter for a specific model
+def get_openrouter_sql_response(question, prompt, model_id, timeout=None, use_cache=True):
+    if use_cache:
+        start = time.perf_counter()
+        cached = get_cached_response(model_id, prompt[0], question)
+        if cached is not None:
+            record("llm", time.perf_counter() - start, model_id, cached=True)
+            return cached
+    if not OPENROUTER_API_KEY:
+        return "Error: OpenRouter API key not configured. Please add OPENROUTER_API_KEY to your .env file."
+    data = _chat_payload(question, prompt, model_id)
+    start = time.perf_counter()
+    try:
+        response = post_chat_completion(data, OPENROUTER_API_KEY, timeout=timeout)
+    except requests.Timeout:
+        record("llm", time.perf_counter() - start, model_id, error="timeout")
+        return f"Error: OpenRouter request timed out after {timeout}s"
+    except requests.ConnectionError as e:
+        record("llm", time.perf_counter() - start, model_id, error=f"connection error: {e}")
+        return f"Error: could not reach OpenRouter: {e}"
+    elapsed = time.perf_counter() - start
+    if response.status_code == 200:
+        result = response.json()
+        usage = result.get("usage") or {}
+        record("llm", elapsed, model_id, status=200, prompt_tokens=usage.get("prompt_tokens"),
+               completion_tokens=usage.get("completion_tokens"))
+        if "choices" in result and len(result["choices"]) > 0:
+            content = result["choices"][0]["message"]["content"].strip()
+            # Only successful answers are cached; errors should be retried next time
+            if use_cache and content:
+                put_cached_response(model_id, prompt[0], question, content)
+            return content
+        else:
+            return str(result)
+    else:
+        record("llm", elapsed, model_id, status=response.status_code, error=response.text[:200])
+        return f"Error from OpenRouter API: {response.status_code} {response.text}"
+
+# Read the rest of a stream that was cut short at a complete statement, up to the usage chunk
+# OpenRouter sends last, and record the "llm" stage (with the latency to the complete statement)
+# once it arrives. Runs on a background thread so the SQL executes meanwhile; gives up at deadline.
+def _record_stream_usage(response, events, model_id, elapsed, deadline):
+    usage = {}
+    try:
+        for event in events:
+            usage = event.get("usage") or usage
+            if usage or time.monotonic() > deadline:
+                break
+    except requests.RequestException:
+        pass
+    finally:
+        response.close()
+    if not usage:
+        print(f"No token usage reported for {model_id}; its tokens are not recorded for this call.")
+    record("llm", elapsed, model_id, status=200, prompt_tokens=usage.get("prompt_tokens"),
+           completion_tokens=usage.get("completion_tokens"))
+
+# Streaming variant: on_token(text so far) is called as tokens arrive. The function returns as soon
+# as the text holds a complete statement, so the SQL can run while the model is still talking; the
+# rest of the stream is read in the background for its token usage.
+# Time to first token is recorded as the "llm_ttft" stage.
+def stream_openrouter_sql_response(question, prompt, model_id, timeout=None, use_cache=True, on_token=None):
+    on_token = on_token or (lambda text: None)
+    if use_cache:
+        start = time.perf_counter()
+        cached = get_cached_response(model_id, prompt[0], question)
+        if cached is not None:
+            record("llm", time.perf_counter() - start, model_id, cached=True)
+            on_token(cached)
+            return cached
+    if not OPENROUTER_API_KEY:
+        return "Error: OpenRouter API key not configured. Please add OPENROUTER_API_KEY to your .env file."
+    data = _chat_payload(question, prompt, model_id)
+    data["stream"] = True
+    start = time.perf_counter()
+    deadline = time.monotonic() + (timeout or READ_TIMEOUT)
+    try:
+        response = post_chat_completion(data, OPENROUTER_API_KEY, timeout=timeout, stream=True)
+    except requests.Timeout:
+        record("llm", time.perf_counter() - start, model_id, error="timeout")
+        return f"Error: OpenRouter request timed out after {timeout}s"
+    except requests.ConnectionError as e:
+        record("llm", time.perf_counter() - start, model_id, error=f"connection error: {e}")
+        return f"Error: could not reach OpenRouter: {e}"
+    try:
+        if response.status_code != 200:
+            record("llm", time.perf_counter() - start, model_id, status=response.status_code,
+                   error=response.text[:200])
+            return f"Error from OpenRouter API: {response.status_code} {response.text}"
+        content = ""
+        usage = {}
+        first_token = None
+        complete = False
+        events = iter_sse_events(response)
+        try:
+            for event in events:
+                if event.get("error"):
+                    message = event["error"].get("message", event["error"])
+                    record("llm", time.perf_counter() - start, model_id, status=200, error=str(message)[:200])
+                    return f"Error from OpenRouter API: {message}"
+                usage = event.get("usage") or usage
+                choices = event.get("choices") or []
+                delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                if not delta:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    record("llm_ttft", first_token, model_id)
+                content += delta
+                on_token(content)
+                if is_complete_statement(content):
+                    complete = True
+                    break
+        except requests.RequestException as e:
+            record("llm", time.perf_counter() - start, model_id, status=200, error=f"stream interrupted: {e}")
+            return f"Error: OpenRouter stream interrupted: {e}"
+        if complete and not usage:
+            # The response is closed by the background reader
+            threading.Thread(
+                target=_record_stream_usage, name="llm-usage", daemon=True,
+                args=(response, events, model_id, time.perf_counter() - start, deadline)
+            ).start()
+            response = None
+        else:
+            record("llm", time.perf_counter() - start, model_id, status=200,
+                   prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+        content = content.strip()
+        if use_cache and content:
+            put_cached_response(model_id, prompt[0], question, content)
+        return content
+    finally:
+        if response is not None:
+            response.close()
+
+# Function to retrieve query from the database using a pooled read-only connection
+def read_sql_query(sql, db):
+    result = execute_sql_bounded(sql, db, max_rows=None, timeout=None)
+    return result["rows"], result["columns"]
+
+# Stream rows with fetchmany, keeping at most max_rows but counting and fingerprinting all of them,
+# and abort the query through the progress handler once the deadline passes. A timed out query
+# has no fingerprint, since only part of its result was seen.
+def execute_sql_bounded(sql, db, max_rows=SQL_MAX_ROWS, timeout=SQL_TIMEOUT):
+    start = time.monotonic()
+    deadline = start + timeout if timeout else None
+    rows = []
+    total_rows = 0
+    timed_out = False
+    fingerprint = Fingerprint()
+    with get_pool(db).connection() as conn:
+        if deadline is not None:
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        cur = conn.cursor()
+        try:
+            cur.execute(sql)
+            columns = [desc[0] for desc in cur.description] if cur.description else []
+            while True:
+                batch = cur.fetchmany(SQL_FETCH_SIZE)
+                if not batch:
+                    break
+                total_rows += len(batch)
+                fingerprint.update(batch)
+                if max_rows is None:
+                    rows.extend(batch)
+                elif len(rows) < max_rows:
+                    rows.extend(batch[:max_rows - len(rows)])
+        except sqlite3.OperationalError as e:
+            if deadline is None or "interrupted" not in str(e):
+                raise
+            timed_out = True
+            if total_rows == 0 and not rows:
+                columns = [desc[0] for desc in cur.description] if cur.description else []
+        finally:
+            cur.close()
+            if deadline is not None:
+                conn.set_progress_handler(None, 0)
+    return {
+        "rows": rows,
+        "columns": columns,
+        "total_rows": total_rows,
+        "truncated": max_rows is not None and total_rows > len(rows),
+        "timed_out": timed_out,
+        "fingerprint": None if timed_out else fingerprint.hexdigest(),
+        "elapsed": time.monotonic() - start,
+    }
+
+# EXPLAIN QUERY PLAN summary for the generated SQL (see index_advisor); None if it cannot be planned
+def explain_sql(sql, db):
+    try:
+        with get_pool(db).connection() as conn:
+            plan = analyze_sql(conn, sql)
+    except sqlite3.Error:
+        return None
+    plan.pop("parsed")
+    plan.pop("aliases")
+    return plan
+
+# Human readable note for truncated or timed out results
+def describe_limits(result, timeout=SQL_TIMEOUT):
+    notes = []
+    if result["timed_out"]:
+        notes.append(f"timed out after {timeout:g} s (at least {result['total_rows']} rows)")
+    if result["truncated"]:
+        notes.append(f"truncated after {len(result['rows'])} rows")
+        if not result["timed_out"]:
+            notes[-1] += f" of {result['total_rows']}"
+    return "; ".join(notes)
+
+# Ask one model for SQL and run it against the database as soon as the answer arrives.
+# With stream=True, on_update receives {"sql": text so far, "status": "streaming" / "executing" / "done"}.
+def run_model(question, prompt, model, db=DB_PATH, timeout=None, use_cache=True,
+              max_rows=SQL_MAX_ROWS, sql_timeout=SQL_TIMEOUT, stream=False, on_update=None):
+    started = time.perf_counter()
+    on_update = on_update or (lambda event: None)
+    first_token = []
+    if stream:
+        def on_token(text):
+            if not first_token:
+                first_token.append(time.perf_counter() - started)
+            on_update({"sql": text, "status": "streaming"})
+
+        sql_query = stream_openrouter_sql_response(question, prompt, model["id"], timeout=timeout,
+                                                   use_cache=use_cache, on_token=on_token)
+    else:
+        sql_query = get_openrouter_sql_response(question, prompt, model["id"], timeout=timeout, use_cache=use_cache)
+    on_update({"sql": sql_query, "status": "executing"})
+    sql_output = None
+    error = None
+    result = None
+    plan = None
+    limits = ""
+    if sql_query and not sql_query.startswith("Error:"):
+        try:
+            # Equivalent SQL from different models (or earlier runs on the same data) executes once.
+            # The canonical form is only the cache key; the SQL as written (minus fences) is run.
+            canonical_sql = canonicalize_sql(sql_query)
+            runnable_sql = strip_fences(sql_query)
+            plan = explain_sql(runnable_sql, db)
+            executed = []
+
+            def execute():
+                executed.append(True)
+                return execute_sql_bounded(runnable_sql, db, max_rows, sql_timeout)
+
+            with timed("sql", model["id"]) as measured:
+                result = result_cache.get_or_execute(
+                    canonical_sql, db, execute,
+                    extra_key=max_rows, should_cache=lambda r: not r["timed_out"]
+                )
+                measured.update(rows=result["total_rows"], cached=not executed,
+                                error="timeout" if result["timed_out"] else None)
+            if result["timed_out"] and not result["rows"]:
+                error = f"Error executing SQL: timed out after {sql_timeout:g} s"
+            else:
+                # Rows stay typed; the markdown table is only built where text is read
+                limits = describe_limits(result, sql_timeout)
+                sql_output = f"{result['total_rows']:,} rows" if result["rows"] else "(No results)"
+                if limits:
+                    sql_output += f" ({limits})"
+        except Exception as e:
+            error = f"Error executing SQL: {e}"
+    elif sql_query and sql_query.startswith("Error:"):
+        error = sql_query
+    on_update({"sql": sql_query, "status": "done"})
+    return {
+        "Model": model["name"],
+        "Model ID": model["id"],
+        "Generated SQL": sql_query,
+        "SQL Output": sql_output if not error else error,
+        "Result": result if not error else None,
+        "Row Count": result["total_rows"] if result and not error else None,
+        "Fingerprint": result["fingerprint"] if result and not error else None,
+        "Limits": limits if result and not error else "",
+        "Plan": plan,
+        "Latency (ms)": round((time.perf_counter() - started) * 1000),
+        "TTFT (ms)": round(first_token[0] * 1000) if first_token else None
+    }
+
+# Run every model for a question. In concurrent mode all requests are sent at once
+# (capped by max_workers) and results come back in OPENROUTER_MODELS order.
+def run_comparison(question, prompt, models=OPENROUTER_MODELS, db=DB_PATH, concurrent=True,
+                   max_workers=LLM_MAX_WORKERS, timeout=LLM_MODEL_TIMEOUT, use_cache=True,
+                   max_rows=SQL_MAX_ROWS, sql_timeout=SQL_TIMEOUT, stream=False, on_update=None):
+    # on_update(model index, event) for streamed progress; it is called from the worker threads
+    def updater(idx):
+        return (lambda event: on_update(idx, event)) if on_update else None
+
+    if not concurrent:
+        return [run_model(question, prompt, model, db, timeout, use_cache, max_rows, sql_timeout, stream, updater(idx))
+                for idx, model in enumerate(models)]
+
+    results = [None] * len(models)
+    started = {}
+
+    # Each model's timeout runs from the moment a worker picks it up, not from submission
+    def run_timed(idx, model):
+        started[idx] = time.monotonic()
+        return run_model(question, prompt, model, db, timeout, use_cache, max_rows, sql_timeout, stream, updater(idx))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(models))))
+    try:
+        futures = {executor.submit(run_timed, idx, model): idx for idx, model in enumerate(models)}
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started] if timeout else []
+            remaining = max(0, min(deadlines) - now) if deadlines else None
+            if timeout and len(deadlines) < len(pending):
+                # Queued models have no deadline yet; look again shortly to start their clocks
+                remaining = min(remaining if remaining is not None else 0.1, 0.1)
+            done, pending = wait(pending, timeout=remaining, return_when="FIRST_COMPLETED")
+            for future in done:
+                idx = futures[future]
+                try:
+                    results[idx] = future.result()
+                except Exception as e:
+                    results[idx] = {
+                        "Model": models[idx]["name"],
+                        "Model ID": models[idx]["id"],
+                        "Generated SQL": "",
+                        "SQL Output": f"Error: {e}"
+                    }
+            if not timeout:
+                continue
+            now = time.monotonic()
+            for future in [f for f in pending if futures[f] in started and now >= started[futures[f]] + timeout]:
+                # The worker thread cannot be stopped; its answer is dropped when it arrives
+                idx = futures[future]
+                pending.discard(future)
+                results[idx] = {
+                    "Model": models[idx]["name"],
+                    "Model ID": models[idx]["id"],
+                    "Generated SQL": "",
+                    "SQL Output": f"Error: timed out after {timeout}s"
+                }
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
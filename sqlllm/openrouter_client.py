@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import random
+import threading
+import email.utils
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Timeouts and retry policy for OpenRouter calls
+CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "90"))
+MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("OPENROUTER_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("OPENROUTER_BACKOFF_MAX", "20"))
+POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "16"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# New connections are counted per thread so a request can tell whether it reused one
+_local = threading.local()
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _local.new_connections = getattr(_local, "new_connections", 0) + 1
+        return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _local.new_connections = getattr(_local, "new_connections", 0) + 1
+        return super()._new_conn()
+
+class _CountingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+_session = None
+_session_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+# One keep-alive session per process, shared across Streamlit reruns and sessions
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = _CountingAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+def _record(model_id, **counts):
+    with _stats_lock:
+        stats = _stats.setdefault(model_id, {
+            "requests": 0, "retries": 0, "errors": 0,
+            "new_connections": 0, "reused_connections": 0,
+        })
+        for key, value in counts.items():
+            stats[key] += value
+
+# Per-model counters: requests, retries, errors, new and reused connections
+def get_client_stats():
+    with _stats_lock:
+        return {model_id: dict(stats) for model_id, stats in _stats.items()}
+
+def reset_client_stats():
+    with _stats_lock:
+        _stats.clear()
+
+# Seconds to wait before the next attempt, honouring Retry-After when the server sends it
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            try:
+                parsed = email.utils.parsedate_to_datetime(retry_after)
+                return min(max(0.0, parsed.timestamp() - time.time()), BACKOFF_MAX)
+            except (TypeError, ValueError):
+                pass
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+# POST a chat-completions payload, retrying 429/5xx and failures to connect. A read timeout is not
+# retried: the model may still be generating (and billing) the completion. timeout is the caller's
+# budget for the whole call, retries and backoff included; without it each attempt gets READ_TIMEOUT.
+# Returns the final requests.Response; raises the last exception if every attempt failed.
+# With stream=True the body is left unread for iter_sse_events; retries only happen before it starts.
+def post_chat_completion(payload, api_key, timeout=None, max_retries=MAX_RETRIES, stream=False):
+    session = get_session()
+    model_id = payload.get("model", "")
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    attempt = 0
+    while True:
+        _local.new_connections = 0
+        response = None
+        read_timeout = READ_TIMEOUT if deadline is None else max(deadline - time.monotonic(), 0.001)
+        try:
+            response = session.post(
+                OPENROUTER_URL, headers=headers, json=payload,
+                timeout=(min(CONNECT_TIMEOUT, read_timeout), read_timeout), stream=stream
+            )
+        except requests.ConnectionError:
+            # Includes ConnectTimeout; ReadTimeout is not a ConnectionError and is raised as is
+            _record(model_id, requests=1, errors=1, new_connections=_local.new_connections)
+            if attempt >= max_retries:
+                raise
+        except requests.Timeout:
+            _record(model_id, requests=1, errors=1, new_connections=_local.new_connections)
+            raise
+        else:
+            reused = 0 if _local.new_connections else 1
+            _record(model_id, requests=1, new_connections=_local.new_connections, reused_connections=reused)
+            if response.status_code not in RETRY_STATUSES or attempt >= max_retries:
+                return response
+            _record(model_id, errors=1)
+        delay = _retry_delay(response, attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            # No time left for another attempt: hand back what the last one produced
+            if response is None:
+                raise requests.Timeout(f"gave up retrying {model_id} after {timeout:g}s")
+            return response
+        if response is not None:
+            response.close()
+        _record(model_id, retries=1)
+        time.sleep(delay)
+        attempt += 1
+
+# Parsed JSON chunks of a streamed (stream=True) chat completion. SSE comment lines such as
+# OpenRouter's ": OPENROUTER PROCESSING" keep-alives are skipped; "data: [DONE]" ends the stream.
+def iter_sse_events(response):
+    # SSE is always UTF-8, whatever the Content-Type charset says
+    response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or line.startswith(":") or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            yield json.loads(data)
+        except ValueError:
+            continue
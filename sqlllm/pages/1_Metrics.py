@@ -0,0 +1,44 @@
+import time
+import pandas as pd
+import streamlit as st
+from metrics import STAGES, load_metrics, summarize
+
+st.set_page_config(page_title="Metrics - Frugal's Business Insights", page_icon="📈", layout="wide")
+st.title("📈 Latency and Token Usage")
+
+WINDOWS = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400, "Last 30 days": 30 * 86400, "All": None}
+
+with st.sidebar:
+    window = st.selectbox("Time window", list(WINDOWS), index=2)
+    include_cached = st.checkbox("Include cache hits", value=False,
+                                 help="Cached LLM answers and SQL results return almost instantly and hide real latency.")
+
+since = time.time() - WINDOWS[window] if WINDOWS[window] else 0
+df = load_metrics(since)
+if not include_cached:
+    df = df[df["cached"] == 0]
+
+if df.empty:
+    st.info("No measurements in this window yet. Run a comparison on the main page first.")
+    st.stop()
+
+st.markdown("### p50 / p95 per stage and model")
+st.dataframe(summarize(df), hide_index=True)
+
+st.markdown("### p50 over time")
+stage = st.selectbox("Stage", [s for s in STAGES if s in set(df["stage"])])
+stage_df = df[df["stage"] == stage].assign(
+    time=pd.to_datetime(df["ts"], unit="s"), model_id=df["model_id"].fillna("-")
+)
+freq = "5min" if WINDOWS[window] and WINDOWS[window] <= 3600 else ("h" if WINDOWS[window] and WINDOWS[window] <= 86400 else "D")
+over_time = stage_df.groupby([pd.Grouper(key="time", freq=freq), "model_id"])["seconds"].quantile(0.5).unstack()
+st.line_chart(over_time)
+
+if stage == "llm":
+    failures = stage_df[stage_df["error"].notna()]
+    if not failures.empty:
+        st.markdown("### Recent LLM errors")
+        st.dataframe(
+            failures.sort_values("ts", ascending=False)[["time", "model_id", "status", "error"]].head(50),
+            hide_index=True
+        )
@@ -0,0 +1,100 @@
+import io
+import os
+import mmap
+import time
+from collections import deque
+import pandas as pd
+from bulk_load import csv_dtypes
+
+# Files larger than this are split into byte ranges parsed by different workers
+SPLIT_BYTES = int(os.getenv("INGEST_SPLIT_BYTES", str(16 * 1024 * 1024)))
+
+# Byte ranges [start, end) covering the data rows of a CSV, each ending on a line boundary.
+# Files containing quotes are never split because a quoted field may hold a newline.
+def plan_parts(csv_path, split_bytes=SPLIT_BYTES):
+    size = os.path.getsize(csv_path)
+    with open(csv_path, "rb") as f:
+        header_end = len(f.readline())
+        if size <= split_bytes or size == header_end:
+            return [(header_end, size)]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm.find(b'"') != -1:
+                return [(header_end, size)]
+            parts = []
+            start = header_end
+            while start < size:
+                end = min(start + split_bytes, size)
+                if end < size:
+                    newline = mm.find(b"\n", end)
+                    end = size if newline == -1 else newline + 1
+                parts.append((start, end))
+                start = end
+            return parts
+
+# Worker: parse one byte range of a CSV into a typed DataFrame (columnar numpy blocks pickle cheaply)
+def parse_part(csv_path, start, end, dtypes):
+    began = time.perf_counter()
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+        f.seek(start)
+        data = f.read(end - start)
+    frame = pd.read_csv(io.BytesIO(header + data), encoding="utf-8-sig", dtype=dtypes)
+    return frame, time.perf_counter() - began
+
+# Parts queued in the pool at once, per worker. Each finished part holds a parsed DataFrame
+# until the writer consumes it, so this bounds memory however many files are being imported.
+PARTS_PER_WORKER = int(os.getenv("INGEST_PARTS_PER_WORKER", "2"))
+
+# Feeds the parts of several files to the pool in order, keeping at most max_in_flight submitted
+# and not yet consumed, so the single writer can import files in order while the next parts are
+# parsed. Files are planned (dtypes, byte ranges) only when their first part is about to be queued.
+class PartScheduler:
+    def __init__(self, executor, csv_paths, max_in_flight, split_bytes=SPLIT_BYTES):
+        self.executor = executor
+        self.max_in_flight = max(1, max_in_flight)
+        self.split_bytes = split_bytes
+        self.files = deque(csv_paths)
+        self.parts = deque()
+        self.in_flight = deque()
+        self.dtypes = {}
+        self.part_counts = {}
+        self._fill()
+
+    def _plan_next_file(self):
+        csv_path = self.files.popleft()
+        dtypes = csv_dtypes(csv_path)
+        parts = plan_parts(csv_path, self.split_bytes)
+        self.dtypes[csv_path] = dtypes
+        self.part_counts[csv_path] = len(parts)
+        self.parts.extend((csv_path, start, end, dtypes) for start, end in parts)
+
+    def _fill(self):
+        while len(self.in_flight) < self.max_in_flight:
+            if not self.parts:
+                if not self.files:
+                    return
+                self._plan_next_file()
+                continue
+            csv_path, start, end, dtypes = self.parts.popleft()
+            self.in_flight.append((csv_path, self.executor.submit(parse_part, csv_path, start, end, dtypes)))
+
+    def __contains__(self, csv_path):
+        return csv_path in self.dtypes or csv_path in self.files
+
+    def dtypes_for(self, csv_path):
+        while csv_path not in self.dtypes:
+            self._plan_next_file()
+        return self.dtypes[csv_path]
+
+    # Yield parsed frames for one file in part order, accumulating worker parse time in timing.
+    # Files must be consumed in the order they were given; each future is dropped once read.
+    def iter_frames(self, csv_path, timing):
+        self.dtypes_for(csv_path)
+        while True:
+            self._fill()
+            if not self.in_flight or self.in_flight[0][0] != csv_path:
+                return
+            _, future = self.in_flight.popleft()
+            frame, seconds = future.result()
+            timing["parse_seconds"] += seconds
+            yield frame
@@ -0,0 +1,131 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fpdf import FPDF
+from feedback_store import result_markdown
+from metrics import timed
+
+# Rendered reports, one file per (run_id, feedback hash), so re-downloads never re-render
+PDF_REPORT_DIR = os.path.abspath(os.getenv(
+    "PDF_REPORT_DIR", os.path.join(os.path.dirname(__file__), "../.pdf_reports")
+))
+# Result rows kept per model in the PDF, and a character cap for non-table output (errors etc.)
+PDF_ROW_LIMIT = int(os.getenv("PDF_ROW_LIMIT", "50"))
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "4000"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="pdf-report")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+# Stable hash of everything that ends up in the report; result rows are hashed by their blob
+def feedback_hash(question, feedback, row_limit=PDF_ROW_LIMIT):
+    payload = json.dumps({
+        "question": question,
+        "row_limit": row_limit,
+        "feedback": [
+            dict(
+                {key: entry.get(key) for key in ("llm_name", "llm_generated_sql", "llm_output", "success", "comments")},
+                result_blob=hashlib.sha256(entry["result_blob"]).hexdigest() if entry.get("result_blob") else None,
+            )
+            for entry in feedback
+        ],
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def report_path(run_id, digest):
+    safe_run = re.sub(r'[^a-zA-Z0-9_-]+', '_', run_id or "run")
+    return os.path.join(PDF_REPORT_DIR, f"{safe_run}-{digest[:16]}.pdf")
+
+def report_filename(question):
+    safe_query = re.sub(r'[^a-zA-Z0-9]+', '_', question)[:50].strip('_')
+    return f"llm_feedback_output_{safe_query}.pdf"
+
+# Keep the header, separator and first row_limit rows of a markdown table; other text is cut at
+# max_chars. A note says how much was left out.
+def truncate_output(text, row_limit=PDF_ROW_LIMIT, max_chars=PDF_MAX_CHARS):
+    text = text or ""
+    lines = text.splitlines()
+    table_lines = [i for i, line in enumerate(lines) if line.startswith("|")]
+    if len(table_lines) > row_limit + 2:
+        cut = table_lines[row_limit + 1]
+        hidden = len(table_lines) - row_limit - 2
+        trailer = [line for line in lines[table_lines[-1] + 1:] if line.strip()]
+        text = "\n".join(lines[:cut + 1] + [f"... {hidden} more rows not shown"] + trailer)
+    if len(text) > max_chars:
+        text = text[:max_chars] + f"\n... {len(text) - max_chars} more characters not shown"
+    return text
+
+# A model's output for the report: the first row_limit rows of its result, built here from the
+# stored blob, followed by the summary line (row count, limits); errors are printed as they are
+def entry_output(entry, row_limit=PDF_ROW_LIMIT):
+    table = result_markdown(entry.get("result_blob"), row_limit)
+    if table is None:
+        return truncate_output(entry["llm_output"], row_limit)
+    return f"{table}\n\n{entry['llm_output']}"
+
+# The core fonts only cover latin-1
+def _pdf_text(text):
+    return str(text).encode("latin-1", "replace").decode("latin-1")
+
+# Recorded as the "render" stage, per model
+def render_report(path, question, feedback, row_limit=PDF_ROW_LIMIT):
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, txt="LLM Query and Feedback Report", ln=True, align="C")
+    pdf.ln(10)
+    pdf.multi_cell(0, 10, _pdf_text(f"User Query: {question}"))
+    pdf.ln(5)
+    for entry in feedback:
+        with timed("render", entry.get("model_id")):
+            pdf.set_font("Arial", style="B", size=12)
+            pdf.cell(0, 10, txt=_pdf_text(f"LLM: {entry['llm_name']}"), ln=True)
+            pdf.set_font("Arial", size=12)
+            pdf.multi_cell(0, 8, _pdf_text(f"Generated SQL:\n{truncate_output(entry['llm_generated_sql'], row_limit)}"))
+            pdf.multi_cell(0, 8, _pdf_text(f"SQL Output:\n{entry_output(entry, row_limit)}"))
+            status = "Success" if entry['success'] == 1 else ("Failure" if entry['success'] == 0 else "Error")
+            pdf.cell(0, 8, txt=f"Feedback: {status}", ln=True)
+            if entry['comments']:
+                pdf.multi_cell(0, 8, _pdf_text(f"Comments: {entry['comments']}"))
+            pdf.ln(5)
+            pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+            pdf.ln(5)
+    os.makedirs(PDF_REPORT_DIR, exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    pdf.output(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+# Queue a report for rendering and return its job key. An identical report that was already
+# rendered (or is being rendered) is reused.
+def submit_report(run_id, question, feedback, row_limit=PDF_ROW_LIMIT):
+    digest = feedback_hash(question, feedback, row_limit)
+    key = (run_id, digest)
+    path = report_path(run_id, digest)
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is None or (job.done() and (job.exception() or not os.path.exists(path))):
+            if os.path.exists(path):
+                job = _executor.submit(lambda: path)
+            else:
+                entries = [dict(entry) for entry in feedback]
+                job = _executor.submit(render_report, path, question, entries, row_limit)
+            _jobs[key] = job
+    return key
+
+# ("running" | "done" | "failed", path or error message)
+def job_status(key):
+    with _jobs_lock:
+        job = _jobs.get(key)
+    if job is None:
+        path = report_path(*key)
+        return ("done", path) if os.path.exists(path) else ("failed", "unknown report job")
+    if not job.done():
+        return "running", None
+    if job.exception():
+        return "failed", str(job.exception())
+    return "done", job.result()
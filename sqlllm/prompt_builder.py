@@ -0,0 +1,108 @@
+import re
+import threading
+from db_pool import get_pool
+
+# Bookkeeping tables the models never need to see
+HIDDEN_TABLES = {"import_manifest", "rollup_refresh_state", "advised_indexes"}
+
+# Minimum length of a numbered column run (e.g. week_bckt_1, week_bckt_2, ...) before it is collapsed
+MIN_RUN_LENGTH = 3
+
+# Extra guidance for tables built by this repo, included only when the table exists
+TABLE_NOTES = {
+    "weekly_sales_fact": (
+        "weekly_sales_fact holds the weekly sales in long format: one row per prescriber, product, plan and "
+        "week with non-zero units. week_ending_date is an ISO date (YYYY-MM-DD) and week_bckt is the bucket "
+        "number. Prefer it for questions about weeks, date ranges or totals over time, e.g. "
+        "SELECT SUM(units) FROM weekly_sales_fact WHERE week_ending_date >= '2025-05-26';"
+    ),
+    "rollup_territory_product": (
+        "The rollup_* tables are pre-aggregated from weekly_sales_fact and much smaller; use them first for "
+        "totals by territory, product, prescriber or week. units_4wk / units_13wk / units_52wk are totals over "
+        "the latest 4, 13 and 52 weeks of data, and prescribers_* count prescribers with sales in that window."
+    ),
+}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _quote(name):
+    return f"[{name}]" if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name) else name
+
+# Collapse runs of numbered columns with a common prefix and consecutive numbers,
+# e.g. week_bckt_1, ..., week_bckt_104 -> week_bckt_1..104
+def collapse_columns(columns, min_run=MIN_RUN_LENGTH):
+    parts = []
+    i = 0
+    while i < len(columns):
+        match = re.fullmatch(r"(.*?)(\d+)", columns[i])
+        j = i + 1
+        if match:
+            prefix, start = match.group(1), int(match.group(2))
+            while j < len(columns) and columns[j] == f"{prefix}{start + (j - i)}":
+                j += 1
+        if j - i >= min_run:
+            parts.append(f"{_quote(columns[i])}..{start + (j - i) - 1}")
+        else:
+            j = i + 1
+            parts.append(_quote(columns[i]))
+        i = j
+    return parts
+
+def _bucket_example(conn, tables):
+    if "Bckt_To_Week" not in tables or len(tables["Bckt_To_Week"]) < 2:
+        return None
+    bucket_col, date_col = tables["Bckt_To_Week"][:2]
+    rows = conn.execute(
+        f"SELECT {_quote(bucket_col)}, {_quote(date_col)} FROM Bckt_To_Week LIMIT 2"
+    ).fetchall()
+    if len(rows) < 2:
+        return None
+    return (
+        "Numbered bucket columns are weekly sales; Bckt_To_Week maps bucket names to week ending dates, "
+        f"e.g. {rows[0][0]} is the week ending {rows[0][1]} and {rows[1][0]} the week ending {rows[1][1]}."
+    )
+
+def read_schema(conn):
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )]
+    tables = {}
+    for name in names:
+        if name in HIDDEN_TABLES or name.endswith("__staging"):
+            continue
+        tables[name] = [row[1] for row in conn.execute(f"PRAGMA table_info({_quote(name)})")]
+    return tables
+
+def render_prompt(conn, tables):
+    lines = [
+        "You are an expert in converting English questions to SQL queries for a SQLite database "
+        "with these tables and columns:",
+        "",
+    ]
+    for idx, (name, columns) in enumerate(tables.items(), 1):
+        lines.append(f"{idx}. {name}: {', '.join(collapse_columns(columns))}")
+    lines.append("")
+    lines.append("Consider Prescriber as Customer. Quote names that contain spaces with [brackets].")
+    bucket_note = _bucket_example(conn, tables)
+    if bucket_note:
+        lines.append(bucket_note)
+    lines.extend(note for table, note in TABLE_NOTES.items() if table in tables)
+    lines.append("Do not include ``` or the word 'sql' in your output. Only return the SQL query.")
+    return "\n".join(lines)
+
+# Prompt describing the live schema of db, as a one-element list like the old hand-written prompt.
+# Rebuilt only when SQLite's schema_version changes (any CREATE, DROP, ALTER or table swap).
+def build_prompt(db):
+    with get_pool(db).connection() as conn:
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        key = (db, version)
+        with _cache_lock:
+            cached = _cache.get(key)
+        if cached is not None:
+            return cached
+        prompt = [render_prompt(conn, read_schema(conn))]
+    with _cache_lock:
+        _cache.clear()
+        _cache[key] = prompt
+    return prompt
@@ -1,37 +1,109 @@
 import os
 import sqlite3
-import pandas as pd
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from weekly_sales import rebuild_weekly_sales, WEEKLY_SALES_TABLE
+from rollups import refresh_rollups
+from db_utils import quote_identifier, table_exists
+from import_manifest import MANIFEST_TABLE, ensure_manifest, get_manifest, check_file, import_csv, drop_removed
+from snapshot_cache import file_sha256, has_snapshot
+from parallel_ingest import PartScheduler, PARTS_PER_WORKER
+from index_advisor import ADVISOR_TABLE, create_advised_indexes
+
+# Source files feeding the derived weekly fact table and rollups
+SALES_CSV = 'Sales_Data.csv'
+BCKT_CSV = 'Bckt_To_Week.csv'
+ROLLUP_SOURCES = {SALES_CSV, BCKT_CSV, 'Presc_to_Terr.csv', 'Product_Data.csv'}
 
 def get_table_name_from_csv(filename):
     # Remove extension and replace spaces with underscores
     return os.path.splitext(filename)[0].replace(' ', '_')
 
-def main():
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import the CSVs in 'Raw data' into sales_data.db.")
+    parser.add_argument("--full", action="store_true",
+                        help="Drop every table and re-import all CSVs instead of only the changed ones.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Parse CSVs (and parts of large CSVs) in this many processes; the main process writes.")
+    return parser.parse_args()
+
+def main(full=False, workers=1):
     db_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../sales_data.db'))
     raw_data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../Raw data'))
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
-    # 1. Drop all existing tables
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
-    for (table_name,) in tables:
-        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-    conn.commit()
-
-    # 2. For each CSV, create table and import data
-    for filename in os.listdir(raw_data_dir):
-        if filename.endswith('.csv'):
-            csv_path = os.path.join(raw_data_dir, filename)
-            table_name = get_table_name_from_csv(filename)
-            df = pd.read_csv(csv_path)
-            # Clean column names: replace spaces with underscores
-            df.columns = [c.replace(' ', '_') for c in df.columns]
-            df.to_sql(table_name, conn, index=False, if_exists='replace')
-            print(f"Imported {filename} into table {table_name}")
+    # 1. Full reset: drop all existing tables (the manifest goes with them). The list of advised
+    #    indexes is kept so they are rebuilt on the fresh tables.
+    if full:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+        tables = cursor.fetchall()
+        for (table_name,) in tables:
+            if table_name == ADVISOR_TABLE:
+                continue
+            cursor.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+        conn.commit()
+    ensure_manifest(conn)
+    manifest = get_manifest(conn)
+
+    # 2. For each changed CSV, load a staging table and swap it in
+    csv_files = sorted(f for f in os.listdir(raw_data_dir) if f.endswith('.csv'))
+    to_import = []
+    for filename in csv_files:
+        csv_path = os.path.join(raw_data_dir, filename)
+        table_name = get_table_name_from_csv(filename)
+        needs_import, sha = check_file(conn, csv_path, table_name, manifest.get(filename))
+        if not needs_import:
+            print(f"Unchanged: {filename}")
+            continue
+        to_import.append((filename, csv_path, table_name, sha or file_sha256(csv_path)))
+
+    changed = set()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and to_import else None
+    try:
+        # Workers parse the files without a columnar snapshot ahead of the writer, a bounded number
+        # of parts at a time; this process is the only writer and imports them in order
+        to_parse = [csv_path for _, csv_path, _, sha in to_import if not has_snapshot(csv_path, sha)]
+        scheduler = PartScheduler(executor, to_parse, PARTS_PER_WORKER * workers) if executor else None
+        for filename, csv_path, table_name, sha in to_import:
+            start = time.perf_counter()
+            timing = {"parse_seconds": 0.0}
+            if scheduler and csv_path in scheduler:
+                dtypes = scheduler.dtypes_for(csv_path)
+                import_csv(conn, csv_path, table_name, sha, frames=scheduler.iter_frames(csv_path, timing), dtypes=dtypes)
+                parse_note = f", {scheduler.part_counts[csv_path]} part(s) parsed in {timing['parse_seconds']:.2f}s of worker time"
+            else:
+                import_csv(conn, csv_path, table_name, sha)
+                parse_note = ""
+            changed.add(filename)
+            print(f"Imported {filename} into table {table_name} in {time.perf_counter() - start:.2f}s{parse_note}")
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    drop_removed(conn, manifest, set(csv_files))
+
+    # 3. Rebuild the long-format weekly fact table from the wide bucket columns when its sources
+    #    changed, then refresh the pre-aggregated rollups (only changed partitions are rebuilt)
+    sales_csv = os.path.join(raw_data_dir, SALES_CSV)
+    bckt_csv = os.path.join(raw_data_dir, BCKT_CSV)
+    if os.path.exists(sales_csv) and os.path.exists(bckt_csv):
+        if changed & {SALES_CSV, BCKT_CSV} or not table_exists(conn, WEEKLY_SALES_TABLE):
+            rebuild_weekly_sales(conn, sales_csv, bckt_csv)
+        if changed & ROLLUP_SOURCES or not table_exists(conn, 'rollup_refresh_state'):
+            refresh_rollups(conn, 'Presc_to_Terr', 'Product_Data')
+
+    # 4. Reloaded tables lost the indexes the advisor created on them (see index_advisor.py)
+    advised = create_advised_indexes(conn)
+    if advised:
+        print(f"Rebuilt {len(advised)} advised index(es).")
 
     conn.close()
-    print("All tables reset and data imported from CSVs.")
+    if changed:
+        print(f"Imported {len(changed)} changed CSV(s); {len(csv_files) - len(changed)} unchanged.")
+    else:
+        print(f"All tables up to date with {MANIFEST_TABLE}.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    args = parse_args()
+    main(full=args.full, workers=args.workers)
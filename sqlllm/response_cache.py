@@ -0,0 +1,111 @@
+import os
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+
+CACHE_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../llm_response_cache.db"))
+CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+_conn = None
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+def _get_conn():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_response_cache (
+                cache_key TEXT PRIMARY KEY,
+                model_id TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                question TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_cache_last_access ON llm_response_cache (last_access)")
+        _conn.commit()
+    return _conn
+
+# Quoted text in a question, kept verbatim because it usually ends up as a SQL literal
+_QUOTED_RE = re.compile(r"('[^']*'|\"[^\"]*\")")
+
+# Collapse whitespace and drop trailing punctuation so trivially different phrasings share a key.
+# Case is kept: "territory NORTH" and "territory north" can need different literals in the SQL.
+def normalize_question(question):
+    parts = _QUOTED_RE.split(question)
+    text = "".join(part if idx % 2 else re.sub(r"\s+", " ", part) for idx, part in enumerate(parts))
+    return text.strip().rstrip("?.!").strip()
+
+def make_cache_key(model_id, prompt_text, question):
+    prompt_hash = hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()
+    key = hashlib.sha256(f"{model_id}\0{prompt_hash}\0{normalize_question(question)}".encode("utf-8")).hexdigest()
+    return key, prompt_hash
+
+def get_cached_response(model_id, prompt_text, question, ttl=CACHE_TTL_SECONDS):
+    key, _ = make_cache_key(model_id, prompt_text, question)
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        row = conn.execute(
+            "SELECT response, created_at FROM llm_response_cache WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            _counters["misses"] += 1
+            return None
+        if ttl and now - row[1] > ttl:
+            conn.execute("DELETE FROM llm_response_cache WHERE cache_key = ?", (key,))
+            conn.commit()
+            _counters["expired"] += 1
+            _counters["misses"] += 1
+            return None
+        conn.execute("UPDATE llm_response_cache SET last_access = ? WHERE cache_key = ?", (now, key))
+        conn.commit()
+        _counters["hits"] += 1
+        return row[0]
+
+def put_cached_response(model_id, prompt_text, question, response, max_entries=CACHE_MAX_ENTRIES):
+    key, prompt_hash = make_cache_key(model_id, prompt_text, question)
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO llm_response_cache
+                (cache_key, model_id, prompt_hash, question, response, created_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (key, model_id, prompt_hash, normalize_question(question), response, now, now)
+        )
+        # Evict least recently used entries beyond the size bound
+        count = conn.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0]
+        if count > max_entries:
+            cur = conn.execute(
+                """
+                DELETE FROM llm_response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM llm_response_cache ORDER BY last_access LIMIT ?
+                )
+                """,
+                (count - max_entries,)
+            )
+            _counters["evictions"] += cur.rowcount
+        conn.commit()
+
+def get_cache_stats():
+    with _lock:
+        stats = dict(_counters)
+        stats["entries"] = _get_conn().execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0]
+    return stats
+
+def clear_cache():
+    with _lock:
+        conn = _get_conn()
+        conn.execute("DELETE FROM llm_response_cache")
+        conn.commit()
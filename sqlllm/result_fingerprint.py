@@ -0,0 +1,137 @@
+import os
+import hashlib
+import datetime
+import numpy as np
+from collections import Counter
+
+# Floats are compared to this many significant digits, so 0.1 + 0.2 and 0.3 agree
+FINGERPRINT_FLOAT_DIGITS = int(os.getenv("FINGERPRINT_FLOAT_DIGITS", "6"))
+
+_MASK = (1 << 64) - 1
+
+# One value in a type-independent form: 3, 3.0 and "3" agree, strings are trimmed
+def normalize_value(value, digits=FINGERPRINT_FLOAT_DIGITS):
+    if value is None:
+        return "\x00null"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            value = float(value)
+        except ValueError:
+            return value
+    if isinstance(value, int):
+        return str(value)
+    if value != value:
+        return "nan"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return f"{value:.{digits}g}"
+
+# Cell hashes kept to order columns by content; beyond this many cells a result is fingerprinted
+# with its columns in the order the query returned them, in constant memory
+FINGERPRINT_MAX_CELLS = int(os.getenv("FINGERPRINT_MAX_CELLS", "2000000"))
+
+def value_hash(value, digits=FINGERPRINT_FLOAT_DIGITS):
+    digest = hashlib.blake2b(normalize_value(value, digits).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+# splitmix64 finalizer over a uint64 array (multiplication wraps modulo 2**64)
+def _mix(x):
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+# One hash per row of a (rows x width) cell-hash array, combining the cells in column order
+def row_hashes(cells):
+    hashes = np.zeros(len(cells), dtype=np.uint64)
+    for col in range(cells.shape[1]):
+        hashes = _mix(hashes ^ cells[:, col])
+    return hashes
+
+# Columns ordered by a signature of their values (the sum of their cell hashes, which ignores row
+# order), so models that select the same columns in another order agree. Columns with equal
+# signatures hold the same values and cannot be told apart; their cells are sorted within each row.
+def canonical_columns(cells):
+    signatures = cells.sum(axis=0, dtype=np.uint64)
+    order = np.argsort(signatures, kind="stable")
+    cells, signatures = cells[:, order], signatures[order]
+    start = 0
+    for end in range(1, len(signatures) + 1):
+        if end == len(signatures) or signatures[end] != signatures[start]:
+            if end - start > 1:
+                cells[:, start:end] = np.sort(cells[:, start:end], axis=1)
+            start = end
+    return cells
+
+# Row-order- and column-order-insensitive fingerprint of a result set, built as batches of rows
+# are fetched. Cell hashes are buffered so the columns can be put in a canonical order before the
+# rows are hashed; row hashes are then summed (a multiset hash), so row order and batch boundaries
+# do not matter. Results over max_cells are hashed in query column order as they stream in.
+# Column names are ignored: models alias the same aggregate differently.
+class Fingerprint:
+    def __init__(self, digits=FINGERPRINT_FLOAT_DIGITS, max_cells=FINGERPRINT_MAX_CELLS):
+        self.digits = digits
+        self.max_cells = max_cells
+        self.rows = 0
+        self.width = None
+        self.total = 0
+        self.batches = []
+        self.buffered = 0
+
+    def update(self, rows):
+        if not rows:
+            return self
+        if self.width is None:
+            self.width = len(rows[0])
+        cells = np.array(
+            [[value_hash(value, self.digits) for value in row] for row in rows], dtype=np.uint64
+        ).reshape(len(rows), self.width)
+        self.rows += len(rows)
+        if self.batches is None:
+            self.total = (self.total + int(row_hashes(cells).sum(dtype=np.uint64))) & _MASK
+            return self
+        self.batches.append(cells)
+        self.buffered += cells.size
+        if self.buffered > self.max_cells:
+            # Too large to buffer: hash what is buffered, and everything after it, in query order
+            for batch in self.batches:
+                self.total = (self.total + int(row_hashes(batch).sum(dtype=np.uint64))) & _MASK
+            self.batches = None
+        return self
+
+    def hexdigest(self):
+        total = self.total
+        if self.batches:
+            cells = canonical_columns(np.concatenate(self.batches))
+            total = int(row_hashes(cells).sum(dtype=np.uint64))
+        return f"{self.rows}x{self.width or 0}:{total:016x}"
+
+def fingerprint_rows(rows, digits=FINGERPRINT_FLOAT_DIGITS):
+    return Fingerprint(digits).update(rows).hexdigest()
+
+# Models whose results share a fingerprint, largest group first: [(fingerprint, [model names])].
+# Results without a fingerprint (errors, timeouts) are left out.
+def agreement_groups(results):
+    groups = {}
+    for result in results:
+        fingerprint = result.get("Fingerprint")
+        if fingerprint:
+            groups.setdefault(fingerprint, []).append(result["Model"])
+    return sorted(groups.items(), key=lambda item: -len(item[1]))
+
+# The fingerprint most models agree on, or None when no group of two or more is strictly largest
+def consensus_fingerprint(results):
+    return consensus_of({result["Model"]: result.get("Fingerprint") for result in results})
+
+# Same for {model name: fingerprint}, e.g. rows read back from llm_feedback
+def consensus_of(fingerprints):
+    counts = Counter(fp for fp in fingerprints.values() if fp).most_common(2)
+    if not counts or counts[0][1] < 2 or (len(counts) > 1 and counts[1][1] == counts[0][1]):
+        return None
+    return counts[0][0]
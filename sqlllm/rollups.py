@@ -0,0 +1,233 @@
+import hashlib
+import datetime
+from weekly_sales import WEEKLY_SALES_TABLE, WEEKLY_PARTITIONS_TABLE
+
+# Pre-aggregated summary tables over weekly_sales_fact joined with territory and product names.
+# Each rollup is partitioned by prod_id and only partitions whose source rows changed are rebuilt;
+# when only the latest week moved, just the rolling-window columns of the others are recomputed.
+ROLLUP_STATE_TABLE = "rollup_refresh_state"
+ROLLING_WINDOWS = (4, 13, 52)
+
+ROLLUP_TABLES = {
+    "rollup_weekly_sales": """
+        CREATE TABLE IF NOT EXISTS rollup_weekly_sales (
+            territory TEXT,
+            prod_id TEXT,
+            product_name TEXT,
+            week_ending_date DATE,
+            units REAL,
+            prescribers INTEGER
+        )
+    """,
+    "rollup_prescriber_product": """
+        CREATE TABLE IF NOT EXISTS rollup_prescriber_product (
+            presc_no TEXT,
+            territory TEXT,
+            prod_id TEXT,
+            product_name TEXT,
+            units_4wk REAL,
+            units_13wk REAL,
+            units_52wk REAL,
+            units_total REAL,
+            last_sale_week DATE
+        )
+    """,
+    "rollup_territory_product": """
+        CREATE TABLE IF NOT EXISTS rollup_territory_product (
+            territory TEXT,
+            prod_id TEXT,
+            product_name TEXT,
+            units_4wk REAL,
+            units_13wk REAL,
+            units_52wk REAL,
+            units_total REAL,
+            prescribers_4wk INTEGER,
+            prescribers_13wk INTEGER,
+            prescribers_52wk INTEGER,
+            prescribers_total INTEGER
+        )
+    """,
+}
+
+ROLLUP_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_rollup_weekly_sales_prod_week ON rollup_weekly_sales (prod_id, week_ending_date)",
+    "CREATE INDEX IF NOT EXISTS idx_rollup_weekly_sales_terr_week ON rollup_weekly_sales (territory, week_ending_date)",
+    "CREATE INDEX IF NOT EXISTS idx_rollup_prescriber_product_prod ON rollup_prescriber_product (prod_id, territory)",
+    "CREATE INDEX IF NOT EXISTS idx_rollup_prescriber_product_presc ON rollup_prescriber_product (presc_no)",
+    "CREATE INDEX IF NOT EXISTS idx_rollup_territory_product_prod ON rollup_territory_product (prod_id, territory)",
+]
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table)})")]
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+# Hash of a small dimension table; any change to territory or product names refreshes every partition
+def _table_signature(conn, table):
+    if not table or not _table_exists(conn, table):
+        return ""
+    digest = hashlib.sha256()
+    for row in conn.execute(f"SELECT * FROM {_quote(table)} ORDER BY 1, 2"):
+        digest.update(repr(row).encode("utf-8"))
+    return digest.hexdigest()
+
+# Content signature of each partition from the manifest rebuild_weekly_sales writes with the fact
+# table, so no fact rows are read. A fact table without a manifest (built by an older version) has
+# signature None for every partition, which always counts as changed.
+def _partition_signatures(conn):
+    if _table_exists(conn, WEEKLY_PARTITIONS_TABLE):
+        return dict(conn.execute(f"SELECT prod_id, signature FROM {WEEKLY_PARTITIONS_TABLE}").fetchall())
+    return {row[0]: None for row in conn.execute(f"SELECT DISTINCT prod_id FROM {WEEKLY_SALES_TABLE}")}
+
+def _dimension_sources(conn, territory_table, product_table):
+    territory_cols = _columns(conn, territory_table) if territory_table and _table_exists(conn, territory_table) else []
+    product_cols = _columns(conn, product_table) if product_table and _table_exists(conn, product_table) else []
+    if len(territory_cols) >= 2:
+        territory_join = f"LEFT JOIN {_quote(territory_table)} t ON t.{_quote(territory_cols[0])} = f.presc_no"
+        territory_expr = f"t.{_quote(territory_cols[1])}"
+    else:
+        territory_join, territory_expr = "", "NULL"
+    if len(product_cols) >= 2:
+        product_join = f"LEFT JOIN {_quote(product_table)} p ON p.{_quote(product_cols[0])} = f.prod_id"
+        product_expr = f"p.{_quote(product_cols[1])}"
+    else:
+        product_join, product_expr = "", "NULL"
+    return territory_join, territory_expr, product_join, product_expr
+
+def _window_start(latest_week, weeks):
+    latest = datetime.date.fromisoformat(latest_week)
+    return (latest - datetime.timedelta(weeks=weeks)).isoformat()
+
+def _refresh_partition(conn, prod_id, latest_week, sources):
+    territory_join, territory_expr, product_join, product_expr = sources
+    w4, w13, w52 = (_window_start(latest_week, weeks) for weeks in ROLLING_WINDOWS)
+    for table in ROLLUP_TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE prod_id IS ?", (prod_id,))
+    conn.execute(f"""
+        INSERT INTO rollup_weekly_sales (territory, prod_id, product_name, week_ending_date, units, prescribers)
+        SELECT {territory_expr}, f.prod_id, {product_expr}, f.week_ending_date, TOTAL(f.units), COUNT(DISTINCT f.presc_no)
+        FROM {WEEKLY_SALES_TABLE} f {territory_join} {product_join}
+        WHERE f.prod_id IS ?
+        GROUP BY 1, 2, 3, 4
+    """, (prod_id,))
+    conn.execute(f"""
+        INSERT INTO rollup_prescriber_product
+            (presc_no, territory, prod_id, product_name, units_4wk, units_13wk, units_52wk, units_total, last_sale_week)
+        SELECT f.presc_no, {territory_expr}, f.prod_id, {product_expr},
+               TOTAL(CASE WHEN f.week_ending_date > :w4 THEN f.units END),
+               TOTAL(CASE WHEN f.week_ending_date > :w13 THEN f.units END),
+               TOTAL(CASE WHEN f.week_ending_date > :w52 THEN f.units END),
+               TOTAL(f.units),
+               MAX(f.week_ending_date)
+        FROM {WEEKLY_SALES_TABLE} f {territory_join} {product_join}
+        WHERE f.prod_id IS :prod_id
+        GROUP BY 1, 2, 3, 4
+    """, {"w4": w4, "w13": w13, "w52": w52, "prod_id": prod_id})
+    _refresh_territory_product(conn, prod_id)
+
+# Only the rolling-window columns depend on the latest week. For a partition whose rows did not
+# change they are recomputed from the fact rows inside the 52-week window (an index range scan on
+# prod_id, week_ending_date), with the same joins and grouping as a full rebuild.
+def _refresh_windows(conn, prod_id, latest_week, sources):
+    territory_join, territory_expr, product_join, product_expr = sources
+    w4, w13, w52 = (_window_start(latest_week, weeks) for weeks in ROLLING_WINDOWS)
+    conn.execute(
+        "UPDATE rollup_prescriber_product SET units_4wk = 0, units_13wk = 0, units_52wk = 0 WHERE prod_id IS ?",
+        (prod_id,)
+    )
+    conn.execute(f"""
+        UPDATE rollup_prescriber_product AS r
+        SET units_4wk = w.units_4wk, units_13wk = w.units_13wk, units_52wk = w.units_52wk
+        FROM (
+            SELECT f.presc_no AS presc_no, {territory_expr} AS territory, {product_expr} AS product_name,
+                   TOTAL(CASE WHEN f.week_ending_date > :w4 THEN f.units END) AS units_4wk,
+                   TOTAL(CASE WHEN f.week_ending_date > :w13 THEN f.units END) AS units_13wk,
+                   TOTAL(f.units) AS units_52wk
+            FROM {WEEKLY_SALES_TABLE} f {territory_join} {product_join}
+            WHERE f.prod_id IS :prod_id AND f.week_ending_date > :w52
+            GROUP BY 1, 2, 3
+        ) AS w
+        WHERE r.prod_id IS :prod_id AND r.presc_no = w.presc_no
+          AND r.territory IS w.territory AND r.product_name IS w.product_name
+    """, {"w4": w4, "w13": w13, "w52": w52, "prod_id": prod_id})
+    _refresh_territory_product(conn, prod_id)
+
+def _refresh_territory_product(conn, prod_id):
+    conn.execute("DELETE FROM rollup_territory_product WHERE prod_id IS ?", (prod_id,))
+    conn.execute("""
+        INSERT INTO rollup_territory_product
+            (territory, prod_id, product_name, units_4wk, units_13wk, units_52wk, units_total,
+             prescribers_4wk, prescribers_13wk, prescribers_52wk, prescribers_total)
+        SELECT territory, prod_id, product_name,
+               TOTAL(units_4wk), TOTAL(units_13wk), TOTAL(units_52wk), TOTAL(units_total),
+               SUM(units_4wk > 0), SUM(units_13wk > 0), SUM(units_52wk > 0), SUM(units_total > 0)
+        FROM rollup_prescriber_product
+        WHERE prod_id IS ?
+        GROUP BY 1, 2, 3
+    """, (prod_id,))
+
+# Bring the rollup tables up to date with weekly_sales_fact. Returns the list of refreshed partitions.
+def refresh_rollups(conn, territory_table, product_table, full=False):
+    if not _table_exists(conn, WEEKLY_SALES_TABLE):
+        print(f"Skipping rollups: {WEEKLY_SALES_TABLE} does not exist.")
+        return []
+    for ddl in ROLLUP_TABLES.values():
+        conn.execute(ddl)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ROLLUP_STATE_TABLE} (
+            partition_key TEXT PRIMARY KEY,
+            signature TEXT NOT NULL,
+            refreshed_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    latest_week = conn.execute(f"SELECT MAX(week_ending_date) FROM {WEEKLY_SALES_TABLE}").fetchone()[0]
+    if latest_week is None:
+        for table in ROLLUP_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"DELETE FROM {ROLLUP_STATE_TABLE}")
+        conn.commit()
+        return []
+
+    # Names come from the dimension tables, so a change to either invalidates every partition
+    global_signature = repr((_table_signature(conn, territory_table), _table_signature(conn, product_table)))
+    state = dict(conn.execute(f"SELECT partition_key, signature FROM {ROLLUP_STATE_TABLE}").fetchall())
+    if full or state.get("__global__") != global_signature:
+        for table in ROLLUP_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"DELETE FROM {ROLLUP_STATE_TABLE}")
+        state = {}
+    current = _partition_signatures(conn)
+    changed = [key for key, signature in current.items() if signature is None or state.get(str(key)) != signature]
+    removed = [key for key in state if not key.startswith("__") and key not in {str(k) for k in current}]
+    # Unchanged partitions only need their rolling windows moved when the latest week changed
+    windows_moved = [] if state.get("__latest_week__") == latest_week else [
+        key for key in current if key not in set(changed)
+    ]
+
+    sources = _dimension_sources(conn, territory_table, product_table)
+    for prod_id in changed:
+        _refresh_partition(conn, prod_id, latest_week, sources)
+        conn.execute(
+            f"INSERT OR REPLACE INTO {ROLLUP_STATE_TABLE} (partition_key, signature, refreshed_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+            (str(prod_id), current[prod_id] or "")
+        )
+    for prod_id in windows_moved:
+        _refresh_windows(conn, prod_id, latest_week, sources)
+    for prod_id in removed:
+        for table in ROLLUP_TABLES:
+            conn.execute(f"DELETE FROM {table} WHERE prod_id IS ?", (prod_id,))
+        conn.execute(f"DELETE FROM {ROLLUP_STATE_TABLE} WHERE partition_key = ?", (prod_id,))
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {ROLLUP_STATE_TABLE} (partition_key, signature, refreshed_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+        [("__global__", global_signature), ("__latest_week__", latest_week)]
+    )
+    for ddl in ROLLUP_INDEXES:
+        conn.execute(ddl)
+    conn.commit()
+    moved_note = f"; moved the rolling windows of {len(windows_moved)} more" if windows_moved else ""
+    print(f"Refreshed rollups for {len(changed)} of {len(current)} product partitions{moved_note}.")
+    return changed
@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # snapshots are an optimisation; everything still works from the CSVs
+    pa = None
+
+# Columnar Arrow IPC snapshots of the Raw data CSVs, keyed by the source file's sha256
+SNAPSHOT_DIR = os.path.abspath(os.getenv(
+    "RAW_SNAPSHOT_DIR", os.path.join(os.path.dirname(__file__), "../.snapshots")
+))
+BATCH_ROWS = 50000
+
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def snapshots_enabled():
+    return pa is not None
+
+def snapshot_path(csv_path, sha):
+    stem = os.path.splitext(os.path.basename(csv_path))[0].replace(" ", "_")
+    return os.path.join(SNAPSHOT_DIR, f"{stem}-{sha[:16]}.arrow")
+
+# sha256 of a CSV, cached in a sidecar file so unchanged files are not re-hashed on every read
+def file_fingerprint(csv_path):
+    st = os.stat(csv_path)
+    stem = os.path.splitext(os.path.basename(csv_path))[0].replace(" ", "_")
+    meta_path = os.path.join(SNAPSHOT_DIR, f"{stem}.meta.json")
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta["size"] == st.st_size and meta["mtime"] == st.st_mtime:
+            return meta["sha256"]
+    except (OSError, ValueError, KeyError):
+        pass
+    sha = file_sha256(csv_path)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(meta_path, "w") as f:
+        json.dump({"size": st.st_size, "mtime": st.st_mtime, "sha256": sha}, f)
+    return sha
+
+def has_snapshot(csv_path, sha):
+    return snapshots_enabled() and os.path.exists(snapshot_path(csv_path, sha))
+
+# Categories are stored as plain strings: IPC files cannot change a dictionary between batches
+def _to_arrow_frame(frame):
+    frame = frame.copy()
+    for col in frame.columns:
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].astype(str).where(frame[col].notna(), None)
+    return frame
+
+# Memory-map a snapshot and yield DataFrame batches restored to `dtypes` (if given)
+def iter_snapshot_frames(csv_path, sha, dtypes=None):
+    with pa.memory_map(snapshot_path(csv_path, sha), "r") as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            frame = reader.get_batch(i).to_pandas()
+            yield frame.astype(dtypes) if dtypes else frame
+
+# Pass batches through unchanged while writing them to a snapshot. The snapshot only appears
+# (via an atomic rename) once every batch was written, so a failed load never leaves a partial file.
+def tee_to_snapshot(csv_path, sha, frames):
+    if not snapshots_enabled():
+        yield from frames
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    final_path = snapshot_path(csv_path, sha)
+    tmp_path = final_path + ".tmp"
+    writer = None
+    schema = None
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(_to_arrow_frame(frame), preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pa.ipc.new_file(tmp_path, schema)
+            writer.write_table(table.cast(schema))
+            yield frame
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp_path, final_path)
+            _remove_stale_snapshots(csv_path, final_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _remove_stale_snapshots(csv_path, keep_path):
+    stem = os.path.splitext(os.path.basename(csv_path))[0].replace(" ", "_")
+    for name in os.listdir(SNAPSHOT_DIR):
+        path = os.path.join(SNAPSHOT_DIR, name)
+        if name.startswith(stem + "-") and name.endswith(".arrow") and path != keep_path:
+            os.remove(path)
+
+# Batches for a CSV: from its snapshot when one matches the file hash, otherwise parsed from the
+# CSV (and written to a new snapshot on the way through). Without dtypes the CSV is parsed with the
+# bulk loader's whole-file dtypes, so every chunk has the schema the snapshot was started with.
+def iter_dataset_frames(csv_path, dtypes=None, chunksize=BATCH_ROWS, sha=None):
+    sha = sha or file_fingerprint(csv_path)
+    if has_snapshot(csv_path, sha):
+        return iter_snapshot_frames(csv_path, sha, dtypes)
+    if dtypes is None:
+        from bulk_load import csv_dtypes
+        dtypes = csv_dtypes(csv_path)
+    frames = pd.read_csv(csv_path, encoding="utf-8-sig", dtype=dtypes, chunksize=chunksize)
+    return tee_to_snapshot(csv_path, sha, frames)
+
+# Whole dataset as one DataFrame for pandas-side analysis, e.g. read_dataset("Sales_Data")
+def read_dataset(name, raw_data_dir=None, dtypes=None):
+    raw_data_dir = raw_data_dir or os.path.join(os.path.dirname(__file__), "../Raw data")
+    csv_path = name if name.endswith(".csv") else os.path.join(raw_data_dir, f"{name}.csv")
+    sha = file_fingerprint(csv_path)
+    if has_snapshot(csv_path, sha):
+        with pa.memory_map(snapshot_path(csv_path, sha), "r") as source:
+            frame = pa.ipc.open_file(source).read_all().to_pandas()
+        return frame.astype(dtypes) if dtypes else frame
+    frames = list(iter_dataset_frames(csv_path, dtypes, sha=sha))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -1,112 +1,103 @@
 import os
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 import streamlit as st
-import sqlite3
-import requests
 import pandas as pd
 import matplotlib.pyplot as plt
-from fpdf import FPDF
-import re
 import datetime
+from openrouter_client import get_client_stats
+from response_cache import get_cache_stats
+from sql_result_cache import result_cache
+from db_pool import get_pool
+from metrics import timed
+from prompt_builder import build_prompt
+from pdf_report import submit_report, job_status, report_filename
+from index_advisor import describe_plan
+from result_fingerprint import agreement_groups, consensus_fingerprint
+from feedback_store import get_feedback_writer, fetch_run_feedback, pack_llm_output, encode_result, result_markdown
+from nl2sql import (
+    DB_PATH, OPENROUTER_API_KEY, OPENROUTER_MODELS, LLM_MAX_WORKERS, LLM_MODEL_TIMEOUT, SQL_MAX_ROWS, SQL_TIMEOUT,
+    run_comparison
+)
 
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../sales_data.db"))
+st.set_page_config(page_title="Frugal's Business Insights - Prototype", page_icon="🧠", layout="wide")
+st.title("🧠 Frugal's Business Insights - Prototype")
+st.markdown("---")
 
-# Define the models to compare (OpenRouter model IDs)
-OPENROUTER_MODELS = [
-    {"name": "Claude 3 Sonnet", "id": "anthropic/claude-3-sonnet"},
-    {"name": "Gemini 1.5 Flash", "id": "google/gemini-flash-1.5"},
-    {"name": "GPT-4o", "id": "openai/gpt-4o"},
-    {"name": "O1-mini", "id": "openai/o1-mini"},
-    {"name": "O4-mini", "id": "openai/o4-mini"},
-    {"name": "Qwen 3 (reasoning)", "id": "qwen/qwen3-coder:free"}
-]
+if not OPENROUTER_API_KEY:
+    st.error("⚠️ OpenRouter API key not configured. Please add OPENROUTER_API_KEY to your .env file.")
+    st.stop()
 
-# Function to get SQL query from OpenRouter for a specific model
-def get_openrouter_sql_response(question, prompt, model_id):
-    if not OPENROUTER_API_KEY:
-        return "Error: OpenRouter API key not configured. Please add OPENROUTER_API_KEY to your .env file."
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    # Models that do NOT support 'system' role
-    no_system_role_models = [
-        "qwen/qwen-110b-chat",
-        # Add more model IDs here if needed
-    ]
-    if model_id in no_system_role_models:
-        # Combine prompt and question as a single user message
-        messages = [
-            {"role": "user", "content": prompt[0] + "\n" + question}
-        ]
-    else:
-        messages = [
-            {"role": "system", "content": prompt[0]},
-            {"role": "user", "content": question}
-        ]
-    data = {
-        "model": model_id,
-        "messages": messages,
-        "max_tokens": 256,
-        "temperature": 0
-    }
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
-        result = response.json()
-        if "choices" in result and len(result["choices"]) > 0:
-            return result["choices"][0]["message"]["content"].strip()
-        else:
-            return str(result)
-    else:
-        return f"Error from OpenRouter API: {response.status_code} {response.text}"
+# Read-only connection pool for sales_data.db, shared by every session of this Streamlit server
+@st.cache_resource
+def sales_db_pool():
+    return get_pool(DB_PATH)
 
-# Function to retrieve query from the database
-def read_sql_query(sql, db):
-    conn = sqlite3.connect(db)
-    cur = conn.cursor()
-    cur.execute(sql)
-    rows = cur.fetchall()
-    columns = [desc[0] for desc in cur.description]
-    conn.commit()
-    conn.close()
-    return rows, columns
+sales_db_pool()
 
-# Define your prompt for the new schema
-prompt = [
-    """
-    You are an expert in converting English questions to SQL queries! The SQL database is named sales_data.db and contains the following tables and columns:
+# Re-checks a rendering PDF every second without rerunning the whole page; reruns it once done
+@st.fragment(run_every=1)
+def wait_for_pdf_report(job_key):
+    if job_status(job_key)[0] == "running":
+        st.info("⏳ Building PDF report...")
+    else:
+        st.rerun()
 
-    1. sales_data_table: client_no, report_no, ims_presc_no, ims_presc_spec, ims_presc_zip, plan_id, sls_cat, rx_type, prod_id, src_id, presc_last_nm, presc_first_nm, presc_mid_nm, presc_street_addr, presc_city, presc_st, presc_zip, supp_data, data_dt, bckt_count, bckt1 ... bckt104
-    2. Bckt_To_Week: Week Bucket Name, Week Ending Date
-    3. Product_Data_Table: prod_id, Product Name
-    4. Presc_Territory_Table: ims_presc_no, Territory
-    5. Prescriber_Call_Table: Prescriber ID, Call Date
+# Background writer for llm_feedback.db (WAL, one row per run and model)
+@st.cache_resource
+def feedback_writer():
+    return get_feedback_writer()
 
-    Consider Prescriber as Customer. Additionally, all the bckt columns need to be considered as sales columns. Each Bckt column indicates sales for a particular week. To understand the week name please refer to the Bckt_To_Week mapping table e.g. bckt1 would mean sales for week ending 8/18/25, bckt2 would mean week ending 8/11/25 etc.
+# Result rows shown per page; only the visible page is turned into a DataFrame
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "50"))
 
-    For example:
-    - How many records are in sales_data_table? -> SELECT COUNT(*) FROM sales_data_table;
-    - List all product names in Product_Data_Table. -> SELECT [Product Name] FROM Product_Data_Table;
-    - Show all prescribers in territory 'North'. -> SELECT * FROM Presc_Territory_Table WHERE Territory = 'North';
-    Do not include ``` or the word 'sql' in your output. Only return the SQL query.
-    """
-]
+STREAM_STATUS = {"streaming": "✍️ Writing SQL...", "executing": "⚙️ Running SQL...", "done": "✅ Done"}
 
-st.set_page_config(page_title="Frugal's Business Insights - Prototype", page_icon="🧠", layout="wide")
-st.title("🧠 Frugal's Business Insights - Prototype")
-st.markdown("---")
+# Compressed rows of a model's result for llm_feedback and the PDF report, encoded once per
+# (run, model) instead of on every rerun. The markdown table is built from them only where it is
+# read: the feedback summary below, the PDF job and the exporter.
+def stored_blob(run_id, result):
+    cache = st.session_state.setdefault('stored_blobs', {})
+    key = (run_id, result["Model"])
+    if key not in cache:
+        typed = result.get("Result")
+        cache[key] = encode_result(typed["columns"], typed["rows"]) if typed else None
+    return cache[key]
 
-if not OPENROUTER_API_KEY:
-    st.error("⚠️ OpenRouter API key not configured. Please add OPENROUTER_API_KEY to your .env file.")
-    st.stop()
+# One page of a result as a grid; the page number widget is keyed per run so a new run starts at page 1.
+# Building and sending the page is recorded as the model's "render" stage.
+def show_result_page(result, key):
+    typed = result["Result"]
+    pages = max(1, -(-len(typed["rows"]) // RESULT_PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=key)
+    start = (page - 1) * RESULT_PAGE_SIZE
+    page_rows = typed["rows"][start:start + RESULT_PAGE_SIZE]
+    with timed("render", result.get("Model ID"), rows=len(page_rows)):
+        # Models often return the same name twice (e.g. two SUM(...) columns); the grid needs unique names
+        columns = []
+        for name in typed["columns"]:
+            columns.append(name if name not in columns else f"{name} ({columns.count(name) + 1})")
+        st.dataframe(pd.DataFrame(page_rows, columns=columns), hide_index=True)
 
 st.markdown("## LLM Comparison Table")
 question = st.text_input("Write Query Here:")
 submit = st.button("Compare Across LLMs")
 
+with st.sidebar:
+    st.markdown("### Execution Settings")
+    run_concurrently = st.checkbox("Run models concurrently", value=True)
+    max_workers = st.number_input("Max concurrent models", min_value=1, max_value=len(OPENROUTER_MODELS), value=min(LLM_MAX_WORKERS, len(OPENROUTER_MODELS)))
+    model_timeout = st.number_input("Per-model timeout (seconds)", min_value=5.0, value=LLM_MODEL_TIMEOUT, step=5.0)
+    sql_max_rows = st.number_input("Max rows per result", min_value=10, value=SQL_MAX_ROWS, step=100)
+    sql_timeout = st.number_input("SQL timeout (seconds)", min_value=1.0, value=SQL_TIMEOUT, step=5.0)
+    bypass_cache = st.checkbox("Bypass response cache", value=False, help="Always call the models, even for a question asked before.")
+    stream_responses = st.checkbox("Stream responses", value=True, help="Show the SQL while the models write it and run it as soon as it is complete.")
+
 if 'llm_results' not in st.session_state:
     st.session_state['llm_results'] = None
 if 'llm_feedback' not in st.session_state:
@@ -131,28 +122,54 @@ if run_id:
     st.info(f"Run ID: {run_id}")
 
 if submit and question:
-    results = []
-    feedback = []
-    for model in OPENROUTER_MODELS:
-        sql_query = get_openrouter_sql_response(question, prompt, model["id"])
-        sql_output = None
-        error = None
-        if sql_query and not sql_query.startswith("Error:"):
-            try:
-                response, columns = read_sql_query(sql_query, DB_PATH)
-                df = pd.DataFrame(response, columns=columns)
-                sql_output = df.to_markdown(index=False) if not df.empty else "(No results)"
-            except Exception as e:
-                error = f"Error executing SQL: {e}"
-        elif sql_query and sql_query.startswith("Error:"):
-            error = sql_query
-        results.append({
-            "Model": model["name"],
-            "Generated SQL": sql_query,
-            "SQL Output": sql_output if not error else error
-        })
+    # Built from the live schema; cached until the database schema changes
+    prompt = build_prompt(DB_PATH)
+    options = dict(
+        concurrent=run_concurrently, max_workers=max_workers, timeout=model_timeout,
+        use_cache=not bypass_cache, max_rows=sql_max_rows, sql_timeout=sql_timeout
+    )
+    if stream_responses:
+        # Worker threads cannot touch Streamlit elements: they queue progress events and this
+        # thread drains the queue into one placeholder per model until the comparison finishes
+        updates = queue.Queue()
+        live = st.empty()
+        placeholders = []
+        with live.container():
+            for model in OPENROUTER_MODELS:
+                st.markdown(f"### {model['name']}")
+                placeholders.append(st.empty())
+        with ThreadPoolExecutor(max_workers=1) as runner:
+            future = runner.submit(
+                run_comparison, question, prompt, OPENROUTER_MODELS, stream=True,
+                on_update=lambda idx, event: updates.put((idx, event)), **options
+            )
+            while True:
+                try:
+                    idx, event = updates.get(timeout=0.1)
+                except queue.Empty:
+                    if future.done():
+                        break
+                    continue
+                with placeholders[idx].container():
+                    st.caption(STREAM_STATUS[event["status"]])
+                    st.code(event["sql"] or "", language="sql")
+            results = future.result()
+        live.empty()
+    else:
+        results = run_comparison(question, prompt, OPENROUTER_MODELS, **options)
     st.session_state['llm_results'] = results
     st.session_state['llm_feedback'] = [{} for _ in results]
+    st.session_state['stored_blobs'] = {}
+
+# Connection reuse and retry counters for the shared OpenRouter session
+client_stats = get_client_stats()
+if client_stats:
+    with st.sidebar.expander("OpenRouter client stats"):
+        st.dataframe(pd.DataFrame.from_dict(client_stats, orient="index"))
+with st.sidebar.expander("Response cache stats"):
+    st.json(get_cache_stats())
+with st.sidebar.expander("SQL result cache stats"):
+    st.json(result_cache.stats())
 
 # Always show all LLM sections, even before a query is run
 llm_section_count = len(OPENROUTER_MODELS)
@@ -168,19 +185,52 @@ else:
     } for model in OPENROUTER_MODELS]
     feedback = [{} for _ in range(llm_section_count)]
 
+# Models whose results have the same fingerprint returned the same rows (in any order)
+consensus = None
+if st.session_state['llm_results']:
+    consensus = consensus_fingerprint(results)
+    groups = agreement_groups(results)
+    st.markdown("### Model Agreement")
+    if consensus:
+        agreeing = dict(groups)[consensus]
+        st.success(f"Suggested answer: {', '.join(agreeing)} returned the same result "
+                   f"({len(agreeing)} of {len(results)} models).")
+    elif groups:
+        st.warning("No consensus: no single result was returned by more models than any other.")
+    else:
+        st.warning("No model returned a result to compare.")
+    for fingerprint, models in groups:
+        st.markdown(f"- {', '.join(models)} `{fingerprint}`")
+    st.markdown("---")
+
+feedback_rows = []
 for idx, result in enumerate(results):
     st.markdown(f"### {result['Model']}")
+    if consensus and result.get("Fingerprint"):
+        if result["Fingerprint"] == consensus:
+            st.caption("✅ Agrees with the suggested answer")
+        else:
+            st.caption("⚠️ Differs from the suggested answer")
     col1, col2 = st.columns(2)
     with col1:
         st.markdown("**Generated SQL:**")
         st.code(result["Generated SQL"] or "(No SQL generated)", language="sql")
+        plan = result.get("Plan")
+        if plan:
+            # Rows read by full table scans; 0 means every table is reached through an index
+            st.caption(f"Plan cost: ~{plan['scanned_rows']:,} rows scanned ({describe_plan(plan)})")
+            with st.expander("Query plan"):
+                st.code("\n".join(plan["steps"]))
     with col2:
         st.markdown("**SQL Output:**")
         output_text = result["SQL Output"] or "(No output)"
         if output_text.startswith("Error"):
             st.text_area("Error Output", output_text, height=200, key=f"error_output_{idx}")
+        elif result.get("Result") and result["Result"]["rows"]:
+            st.caption(output_text)
+            show_result_page(result, key=f"page_{run_id}_{idx}")
         else:
-            st.text_area("SQL Output", output_text, height=200, key=f"sql_output_{idx}")
+            st.info(output_text)
     # Feedback section for this LLM
     st.markdown("**Was this output successful?**")
     feedback_disabled = not st.session_state['llm_results']
@@ -197,71 +247,53 @@ for idx, result in enumerate(results):
         if f'comments_{idx}' not in st.session_state:
             st.session_state[f'comments_{idx}'] = ""
         comments = st.text_area(f"Comments for {result['Model']}", key=f"comments_{idx}")
+    result_blob = stored_blob(run_id, result) if st.session_state['llm_results'] else None
     feedback[idx] = {
         "run_id": run_id if st.session_state['llm_results'] else "",
         "user_query": question if st.session_state['llm_results'] else "",
         "llm_name": result["Model"],
         "llm_generated_sql": result["Generated SQL"],
-        "llm_output": result["SQL Output"],
+        "llm_output": output_text,
+        "result_blob": result_blob,
         "success": 1 if success == "Success" else (0 if success == "Failure" else -1),
         "comments": comments
     }
-    # Save feedback immediately to DB if results exist
     if st.session_state['llm_results']:
-        feedback_db_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../llm_feedback.db"))
-        conn = sqlite3.connect(feedback_db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO llm_feedback (run_id, user_query, llm_name, llm_output, success, comments)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (feedback[idx]["run_id"], feedback[idx]["user_query"], feedback[idx]["llm_name"], f"SQL: {feedback[idx]['llm_generated_sql']}\nOutput: {feedback[idx]['llm_output']}", feedback[idx]["success"], feedback[idx]["comments"])
-        )
-        conn.commit()
-        conn.close()
+        feedback_rows.append({
+            "run_id": run_id,
+            "user_query": question,
+            "llm_name": result["Model"],
+            "llm_output": pack_llm_output(result["Generated SQL"], output_text),
+            "success": feedback[idx]["success"],
+            "comments": comments,
+            "generated_sql": result["Generated SQL"],
+            "result_text": output_text,
+            "result_blob": result_blob,
+            "latency_ms": result.get("Latency (ms)"),
+            "row_count": result.get("Row Count"),
+            "model_id": result.get("Model ID"),
+            "result_fingerprint": result.get("Fingerprint")
+        })
     if idx < len(results) - 1:
         st.markdown("---")
 st.session_state['llm_feedback'] = feedback
+# One upsert batch per rerun, written in the background; unchanged rows are skipped
+if feedback_rows:
+    feedback_writer().submit(feedback_rows)
 # Only show submit button if results exist
 if st.session_state['llm_results'] and st.button("Submit Feedback"):
-    # Generate PDF filename from query
-    safe_query = re.sub(r'[^a-zA-Z0-9]+', '_', question)[:50].strip('_')
-    pdf_filename = f"llm_feedback_output_{safe_query}.pdf"
-    pdf_path = os.path.abspath(os.path.join(os.path.dirname(__file__), f"../{pdf_filename}"))
-    # Generate PDF with all results and feedback
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt="LLM Query and Feedback Report", ln=True, align="C")
-    pdf.ln(10)
-    pdf.multi_cell(0, 10, f"User Query: {question}")
-    pdf.ln(5)
-    for entry in feedback:
-        pdf.set_font("Arial", style="B", size=12)
-        pdf.cell(0, 10, txt=f"LLM: {entry['llm_name']}", ln=True)
-        pdf.set_font("Arial", size=12)
-        pdf.multi_cell(0, 8, f"Generated SQL:\n{entry['llm_generated_sql']}")
-        pdf.multi_cell(0, 8, f"SQL Output:\n{entry['llm_output']}")
-        status = "Success" if entry['success'] == 1 else ("Failure" if entry['success'] == 0 else "Error")
-        pdf.cell(0, 8, txt=f"Feedback: {status}", ln=True)
-        if entry['comments']:
-            pdf.multi_cell(0, 8, f"Comments: {entry['comments']}")
-        pdf.ln(5)
-        pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-        pdf.ln(5)
-    pdf.output(pdf_path)
-    st.success(f"Feedback submitted and saved to database! Run ID: {run_id}")
-    st.info(f"PDF created and saved as: {pdf_filename}")
-    with open(pdf_path, "rb") as f:
-        st.download_button("Download Feedback PDF", f, file_name=pdf_filename, mime="application/pdf")
+    try:
+        save_error = None if feedback_writer().flush(timeout=10) else "timed out waiting for the database"
+    except (sqlite3.Error, RuntimeError) as e:
+        save_error = str(e)
+    # The PDF is rendered in the background; an identical report is served from the cache
+    st.session_state['pdf_job'] = submit_report(run_id, question, feedback)
+    if save_error:
+        st.error(f"Feedback was not saved: {save_error}")
+    else:
+        st.success(f"Feedback submitted and saved to database! Run ID: {run_id}")
     # Pull and print all values from llm_feedback for this run_id
-    feedback_db_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../llm_feedback.db"))
-    conn = sqlite3.connect(feedback_db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, run_id, user_query, llm_name, llm_output, success, comments, timestamp FROM llm_feedback WHERE run_id = ? ORDER BY id DESC", (run_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    rows = fetch_run_feedback(run_id)
     st.markdown(f"### Feedback Entries for This Run ID: {run_id}")
     if rows:
         for row in rows:
@@ -269,17 +301,39 @@ if st.session_state['llm_results'] and st.button("Submit Feedback"):
             st.markdown(f"**Run ID:** {row[1]}")
             st.markdown(f"**User Query:** {row[2]}")
             st.markdown(f"**LLM Name:** {row[3]}")
-            st.markdown("**LLM Output:**")
-            st.code(row[4])
-            status = "Success" if row[5] == 1 else ("Failure" if row[5] == 0 else "Error")
+            st.markdown("**Generated SQL:**")
+            st.code(row[4] or "(No SQL generated)", language="sql")
+            st.markdown("**SQL Output:**")
+            table = result_markdown(row[12])
+            st.code(table or row[5])
+            if table:
+                st.caption(row[5])
+            status = "Success" if row[6] == 1 else ("Failure" if row[6] == 0 else "Error")
             st.markdown(f"**Feedback:** {status}")
-            if row[6]:
-                st.markdown(f"**Comments:** {row[6]}")
-            st.markdown(f"**Timestamp:** {row[7]}")
+            if row[7]:
+                st.markdown(f"**Comments:** {row[7]}")
+            if row[9] is not None:
+                st.markdown(f"**Latency:** {row[9]} ms" + (f", {row[10]} rows" if row[10] is not None else ""))
+            if row[11]:
+                st.markdown(f"**Result Fingerprint:** `{row[11]}`")
+            st.markdown(f"**Timestamp:** {row[8]}")
             st.markdown("---")
     else:
         st.info("No feedback entries found for this run.")
 
+# PDF report status for this run: poll while rendering, then offer the download
+pdf_job = st.session_state.get('pdf_job')
+if pdf_job and pdf_job[0] == run_id:
+    pdf_status, pdf_detail = job_status(pdf_job)
+    if pdf_status == "running":
+        wait_for_pdf_report(pdf_job)
+    elif pdf_status == "failed":
+        st.error(f"PDF report failed: {pdf_detail}")
+    else:
+        st.info(f"PDF created and saved as: {pdf_detail}")
+        with open(pdf_detail, "rb") as f:
+            st.download_button("Download Feedback PDF", f, file_name=report_filename(question), mime="application/pdf")
+
 
 
 
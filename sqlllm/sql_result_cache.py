@@ -0,0 +1,112 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("SQL_RESULT_CACHE_MAX_ENTRIES", "256"))
+
+_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+# Quoted strings and identifiers are copied verbatim; comments are dropped and whitespace outside
+# literals is collapsed. Comments are matched before plain words so "--" and "/*" are never split.
+_TOKEN_RE = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[[^\]]*\]|`[^`]*`|--[^\n]*|/\*.*?(?:\*/|$)|\s+"
+    r"|(?:[^'\"\[`\s/-]|/(?!\*)|-(?!-))+|.",
+    re.DOTALL
+)
+
+# Generated SQL without code fences or a leading "sql" tag, otherwise as the model wrote it
+def strip_fences(sql):
+    text = _FENCE_RE.sub("", (sql or "").strip())
+    return re.sub(r"^\s*sql\s*\n", "", text, flags=re.IGNORECASE).strip()
+
+# Reduce generated SQL to a canonical form for cache keys: no code fences, no leading "sql" tag,
+# no comments, single spaces outside literals and no trailing semicolons.
+def canonicalize_sql(sql):
+    if not sql:
+        return ""
+    text = strip_fences(sql)
+    parts = []
+    for token in _TOKEN_RE.findall(text):
+        if token.isspace() or token.startswith("--") or token.startswith("/*"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        else:
+            parts.append(token)
+    text = "".join(parts).strip()
+    while text.endswith(";"):
+        text = text[:-1].rstrip()
+    return text
+
+# True once (possibly partial, streamed) generated SQL ends with a complete statement, i.e. a
+# terminating semicolon outside any literal or comment
+def is_complete_statement(sql):
+    text = strip_fences(sql)
+    return bool(text.strip()) and sqlite3.complete_statement(text)
+
+# Version of the database file: changes whenever a loader rewrites it (including WAL writes)
+def db_version(db):
+    version = []
+    for path in (db, db + "-wal"):
+        try:
+            st = os.stat(path)
+            version.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+class SQLResultCache:
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Return the cached result for (db version, canonical sql), running execute() only once even
+    # when several threads ask for the same query at the same time.
+    def get_or_execute(self, canonical_sql, db, execute, extra_key=None, should_cache=None):
+        key = (os.path.abspath(db), db_version(db), canonical_sql, extra_key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return future.result()
+        try:
+            result = execute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            if should_cache is None or should_cache(result):
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+result_cache = SQLResultCache()
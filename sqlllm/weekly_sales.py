@@ -0,0 +1,139 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from db_utils import swap_table
+from snapshot_cache import iter_dataset_frames
+
+# Long-format weekly fact table built from the 104 wide week bucket columns of the sales data
+WEEKLY_SALES_TABLE = "weekly_sales_fact"
+# Row count and content hash per prod_id, written with each rebuild so the rollups can tell which
+# partitions changed without reading the fact table
+WEEKLY_PARTITIONS_TABLE = "weekly_sales_partitions"
+ID_COLUMNS = ["presc_no", "prod_id", "plan_id"]
+FACT_COLUMNS = ID_COLUMNS + ["week_bckt", "week_ending_date", "units"]
+CHUNK_SIZE = 50000
+
+_MASK = (1 << 64) - 1
+
+# Bucket values are parsed as float32 (half the memory) when that loses nothing at this many
+# decimals; converting back to float64 rounds to it. See bulk_load.csv_dtypes.
+BUCKET_DECIMALS = 6
+
+_BUCKET_RE = re.compile(r"bckt_?(\d+)$", re.IGNORECASE)
+
+# week_bckt_12 (CSV) and bckt12 (sqlite.py schema) both map to bucket 12
+def bucket_number(column_name):
+    match = _BUCKET_RE.search(str(column_name).strip())
+    return int(match.group(1)) if match else None
+
+# Bucket number -> ISO week ending date (YYYY-MM-DD) from the Bckt_To_Week mapping file
+def load_week_map(bckt_csv):
+    mapping = pd.read_csv(bckt_csv, encoding="utf-8-sig", dtype=str)
+    name_col, date_col = mapping.columns[:2]
+    dates = pd.to_datetime(mapping[date_col], format="%m/%d/%y", errors="coerce")
+    week_map = {}
+    for name, date in zip(mapping[name_col], dates):
+        number = bucket_number(name)
+        if number is not None and not pd.isna(date):
+            week_map[number] = date.strftime("%Y-%m-%d")
+    return week_map
+
+# Unpivot one chunk of wide sales rows into (presc_no, prod_id, plan_id, week_bckt, week_ending_date, units).
+# Empty and zero buckets are dropped, so a row exists only for weeks with sales.
+def unpivot_buckets(df, week_map):
+    bucket_cols = [c for c in df.columns if bucket_number(c) in week_map]
+    if not bucket_cols:
+        return pd.DataFrame(columns=FACT_COLUMNS)
+    numbers = np.array([bucket_number(c) for c in bucket_cols])
+    dates = np.array([week_map[n] for n in numbers], dtype=object)
+    # Buckets may arrive as float32 (bulk loader dtypes, snapshots); only those are rounded, to the
+    # decimals csv_dtypes checked they hold. float64 and text buckets are kept as parsed.
+    values = df[bucket_cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64, copy=True)
+    is_float32 = np.array([df[c].dtype == np.float32 for c in bucket_cols])
+    if is_float32.any():
+        values[:, is_float32] = values[:, is_float32].round(BUCKET_DECIMALS)
+    row_idx, col_idx = np.nonzero(np.nan_to_num(values) != 0)
+    long_df = pd.DataFrame({
+        col: (df[col].to_numpy(dtype=object)[row_idx] if col in df.columns else None)
+        for col in ID_COLUMNS
+    })
+    long_df["week_bckt"] = numbers[col_idx]
+    long_df["week_ending_date"] = dates[col_idx]
+    long_df["units"] = values[row_idx, col_idx]
+    return long_df
+
+def create_weekly_sales_table(conn, table=WEEKLY_SALES_TABLE):
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute(f"""
+        CREATE TABLE {table} (
+            presc_no TEXT,
+            prod_id TEXT,
+            plan_id TEXT,
+            week_bckt INTEGER,
+            week_ending_date DATE,
+            units REAL
+        )
+    """)
+
+# Indexes are built after the insert so the load itself stays append-only
+def create_weekly_sales_indexes(conn, table=WEEKLY_SALES_TABLE):
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_week_prod ON {table} (week_ending_date, prod_id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_presc_week ON {table} (presc_no, week_ending_date)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_prod_week ON {table} (prod_id, week_ending_date)")
+
+def insert_weekly_sales(conn, long_df, table=WEEKLY_SALES_TABLE):
+    conn.executemany(
+        f"INSERT INTO {table} (presc_no, prod_id, plan_id, week_bckt, week_ending_date, units) VALUES (?, ?, ?, ?, ?, ?)",
+        long_df[FACT_COLUMNS].itertuples(index=False, name=None)
+    )
+
+# Order-independent content hash of each prod_id's fact rows, accumulated chunk by chunk while the
+# table is built: pandas row hashes summed per prod_id modulo 2**64 (as two 32-bit halves, so the
+# grouped sums cannot overflow). digests maps prod_id -> (rows, hash).
+def add_partition_digests(digests, long_df):
+    if long_df.empty:
+        return digests
+    hashes = pd.util.hash_pandas_object(long_df[FACT_COLUMNS], index=False).to_numpy()
+    grouped = pd.DataFrame({
+        "prod_id": long_df["prod_id"].to_numpy(dtype=object),
+        "high": hashes >> np.uint64(32),
+        "low": hashes & np.uint64(0xFFFFFFFF),
+    }).groupby("prod_id", dropna=False).agg(rows=("low", "size"), high=("high", "sum"), low=("low", "sum"))
+    for prod_id, rows, high, low in grouped.itertuples(name=None):
+        prod_id = None if pd.isna(prod_id) else prod_id
+        count, total = digests.get(prod_id, (0, 0))
+        digests[prod_id] = (count + int(rows), (total + (int(high) << 32) + int(low)) & _MASK)
+    return digests
+
+def write_partition_manifest(conn, digests):
+    conn.execute(f"DROP TABLE IF EXISTS {WEEKLY_PARTITIONS_TABLE}")
+    conn.execute(f"CREATE TABLE {WEEKLY_PARTITIONS_TABLE} (prod_id TEXT, row_count INTEGER, signature TEXT NOT NULL)")
+    conn.executemany(
+        f"INSERT INTO {WEEKLY_PARTITIONS_TABLE} (prod_id, row_count, signature) VALUES (?, ?, ?)",
+        [(prod_id, rows, f"{rows}:{total:016x}") for prod_id, (rows, total) in digests.items()]
+    )
+
+# Rebuild the weekly fact table from the raw sales and bucket mapping CSVs. The new table is
+# built under a staging name and swapped in atomically, then indexed and its partition manifest
+# written in the same transaction.
+def rebuild_weekly_sales(conn, sales_csv, bckt_csv, chunksize=CHUNK_SIZE):
+    week_map = load_week_map(bckt_csv)
+    staging = f"{WEEKLY_SALES_TABLE}__staging"
+    create_weekly_sales_table(conn, staging)
+    total = 0
+    digests = {}
+    for chunk in iter_dataset_frames(sales_csv, chunksize=chunksize):
+        long_df = unpivot_buckets(chunk, week_map)
+        insert_weekly_sales(conn, long_df, staging)
+        add_partition_digests(digests, long_df)
+        total += len(long_df)
+    conn.commit()
+
+    def after_swap(conn):
+        create_weekly_sales_indexes(conn)
+        write_partition_manifest(conn, digests)
+
+    swap_table(conn, staging, WEEKLY_SALES_TABLE, after_swap)
+    print(f"Built {WEEKLY_SALES_TABLE} with {total} rows from {os.path.basename(sales_csv)}.")
+    return total